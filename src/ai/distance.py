@@ -1,38 +1,175 @@
 '''
 Functions to finds distances between to tiles in a board.
+
+Squares are handled internally as integer ids: square (x,y) has the id y*width+x.
+The distances are stored in flat arrays, so that the distance from square id 'a' to square id 'b'
+is found at index a*n+b, where n is the number of squares on the board.
 '''
-import itertools
-import queue
+from array import array
+from collections import OrderedDict
+import hashlib
+import mmap
+import os
+import pathlib
+import sys
+import configload
 import skill
 
 
+# Marks a square which cannot be reached from the source square at all
+UNREACHABLE = -1
+
+
 class DistanceMap:
     '''
     Class calculates and handles the distance between two squares.
+    In lazy mode the distances from a square are calculated only when they are first needed, and kept
+    in a least-recently-used cache whose size is limited by 'cache_size_mb'.
+    Without lazy mode, the disk cache stores the full distances in the cache directory, keyed by the terrain of the
+    map, and later loads of the same map memory-map them instead of calculating them again. The least recently used
+    files are removed when the files take more than 'disk_cache_size_mb'. In lazy mode the disk cache is not used.
     '''
-    def __init__(self, board) -> None:
+    def __init__(self, board, lazy=None, cache_size_mb=None, disk_cache=None, disk_cache_size_mb=None) -> None:
+        if lazy is None:
+            lazy = configload.get_setting('distances', 'lazy', False)
+        if cache_size_mb is None:
+            cache_size_mb = configload.get_setting('distances', 'cache_size_mb', 32)
+        if disk_cache is None:
+            disk_cache = configload.get_setting('distances', 'disk_cache', False)
+        if disk_cache_size_mb is None:
+            disk_cache_size_mb = configload.get_setting('distances', 'disk_cache_size_mb', 256)
+        self.lazy = lazy
+        self.cache_size_mb = cache_size_mb
+        self.disk_cache = disk_cache
+        self.disk_cache_size_mb = disk_cache_size_mb
         self.build(board)
 
+    def __deepcopy__(self, memo):
+        '''
+        The distances depend only on the terrain of the board, which does not change during the game.
+        Thus copies of the game (e.g. the ones the AI uses) can share the same distance map.
+        '''
+        return self
+
+    def __getstate__(self):
+        '''
+        Memory-mapped distances cannot be pickled; they are opened again from the cache files when unpickling.
+        The lazily calculated rows are left out to keep the pickled state small.
+        '''
+        state = dict(self.__dict__)
+        state['rows'] = OrderedDict()
+        if self.cache_files:
+            state['maps'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for sk, path in self.cache_files.items():
+            self.maps[sk] = open_distances(path, self.n)
+
     def build(self, board):
         '''
         Method builds its distance maps, that is, distances between any two squares.
+        Skill sets which result in the same passable squares share the same distances.
+        In lazy mode only the passable squares are determined here; the distances are calculated on demand.
+        Otherwise the full distances are calculated, or loaded from the disk cache if it is in use.
         '''
-        self.maps = {}
-        self.maps[None] = calculate_distances(board)
-        movement_skills = skill.Skill.movement_skills
-        for sk in movement_skills:
-            self.maps[sk] = calculate_distances(board, movement_skills=[sk])
+        self.width      = board.width
+        self.height     = board.height
+        self.n          = self.width * self.height
+        self.neighbours = calculate_neighbours(self.width, self.height)
+        self.passable   = []            # Distinct passability masks
+        self.mask_ids   = {}            # Skill id -> index in self.passable
+        self.maps       = {}            # Skill id -> full distance array (eager mode only)
+        self.rows       = OrderedDict() # (source, mask index) -> distance row (lazy mode only)
+        self.max_rows   = max(1, int(self.cache_size_mb * 1024 * 1024) // (2 * self.n))
+        self.cache_files = {}           # Skill id -> path to the memory-mapped distance file (disk cache only)
+
+        masks = {}  # Passability mask -> index in self.passable
+        for sk in [None] + skill.Skill.movement_skills:
+            movement_skills = [] if sk is None else [sk]
+            passable = calculate_passable(board, movement_skills)
+            key = bytes(passable)
+            if key not in masks:
+                masks[key] = len(self.passable)
+                self.passable.append(passable)
+            self.mask_ids[sk] = masks[key]
+
+        if self.disk_cache and not self.lazy:
+            try:
+                self.build_from_disk_cache(board)
+                return
+            except OSError:
+                self.cache_files = {}   # Cache directory not usable; calculate in memory instead
+
+        if not self.lazy:
+            built = [calculate_distances(board, neighbours=self.neighbours, passable=passable) for passable in self.passable]
+            for sk, mask_id in self.mask_ids.items():
+                self.maps[sk] = built[mask_id]
+
+    def build_from_disk_cache(self, board):
+        '''
+        Memory-maps the distances of each movement skill set from the cache directory.
+        Distances which are not found in the cache are calculated and written there first, and then the least
+        recently used files are removed if the cache has grown too large.
+        '''
+        cache_dir = pathlib.Path(configload.getdir('cache'))
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        terrain = terrain_key(board)
+        built = {}  # Mask index -> distance array calculated during this call
+        for sk, mask_id in self.mask_ids.items():
+            movement_skills = [] if sk is None else [sk]
+            path = str(cache_dir / (cache_key(terrain, movement_skills) + '.dist'))
+            try:
+                distances = open_distances(path, self.n)
+                os.utime(path)  # The modification time tells when the file was last used
+            except (OSError, ValueError):
+                if mask_id not in built:
+                    built[mask_id] = calculate_distances(board, neighbours=self.neighbours, passable=self.passable[mask_id])
+                write_distances(path, built[mask_id])
+                distances = open_distances(path, self.n)
+            self.cache_files[sk] = path
+            self.maps[sk] = distances
+        if built:
+            evict_cache_files(cache_dir, int(self.disk_cache_size_mb * 1024 * 1024), set(self.cache_files.values()))
+
+    def get_row(self, source, skill_id=None):
+        '''
+        Returns an array of distances from square id 'source' to every square, when the character has a movement
+        skill with 'skill_id'. Used in lazy mode: the row is calculated if it is not in the cache, and the least
+        recently used row is evicted if the cache is full.
+        '''
+        key = (source, self.mask_ids[skill_id])
+        row = self.rows.get(key)
+        if row is not None:
+            self.rows.move_to_end(key)
+            return row
+        row = array('h', [UNREACHABLE]) * self.n
+        calculate_row(source, self.neighbours, self.passable[key[1]], row)
+        self.rows[key] = row
+        if len(self.rows) > self.max_rows:
+            self.rows.popitem(last=False)
+        return row
+
+    def square_id(self, coord):
+        '''
+        Returns the integer id of the square with coordinates (x,y).
+        '''
+        return coord[1] * self.width + coord[0]
 
     def get_distance_with_skill(self, start, end, skill_id=None):
         '''
         Returns distance between two tiles when the character has a movement id with 'skill_id'.
         If skill_id=None, returns distance when no skills are applied.
         '''
-        dist = self.maps[skill_id][coord2str(start)][coord2str(end)]
-        if dist is None:
+        if self.lazy:
+            dist = self.get_row(self.square_id(start), skill_id)[self.square_id(end)]
+        else:
+            dist = self.maps[skill_id][self.square_id(start) * self.n + self.square_id(end)]
+        if dist == UNREACHABLE:
             dist = abs(start[0]-end[0]) + abs(start[1]-end[1])
         return dist
-        
+
     def get_distance(self, char, start, end):
         '''
         Method returns distance between two squares when traversen by character 'char'.
@@ -43,14 +180,14 @@ class DistanceMap:
         for sk in char_movement_skills:
             min_dist = min(min_dist, self.get_distance_with_skill(start, end, sk))
         return min_dist
-    
+
     def distance_between_characters(self, first, second):
         '''
         Returns distance between two characters, that is, number of steps needed for character 'first'
         to reach character 'second'.
         '''
         return self.get_distance(first, first.get_square(), second.get_square())
-    
+
 
 def coord2str(coord):
     '''
@@ -66,71 +203,142 @@ def str2coord(str):
     return (int(splitted[0]), int(splitted[1]))
 
 
-def calculate_distances(board, movement_skills=None):
+def terrain_key(board):
     '''
-    Function applies breadth-first search to find the distance of any two squares, when movement skills given in
-    list 'movement_skills' is applied.
-    Returns a dictionary 'distance_board' in following format:
-        distance_board['x1,y1']['x2,y2']
-        is the distance between squares (x1,y1) and (x2,y2).
+    Returns a string describing the terrain of every square of the board, row by row.
     '''
-    DIRECTIONS = ((0,1),(1,0),(0,-1),(-1,0))
+    return '\n'.join([','.join([board.get_terrain((x,y)).get_terrain() for x in range(board.width)]) for y in range(board.height)])
 
-    if movement_skills is None:
-        movement_skills = []
-    max_x = board.width  -1
-    max_y = board.height -1
-    distance_board = {}
 
-    # Initialize the dictionaries
-    for x,y in itertools.product(list(range(board.width)),list(range(board.height))):
-        distance_board[coord2str((x,y))] = {}
-        for x2,y2 in itertools.product(list(range(board.width)),list(range(board.height))):
-            distance_board[coord2str((x,y))][coord2str((x2,y2))] = None
+def cache_key(terrain, movement_skills):
+    '''
+    Returns the name of the cache file for the given terrain (from terrain_key) and movement skills.
+    The byte order is included, as the files are stored in the native format.
+    '''
+    data = f"{terrain}|{sorted(movement_skills)}|{sys.byteorder}"
+    return hashlib.sha256(data.encode()).hexdigest()
 
-    all_squares = [(x,y) for x in range(board.width) for y in range(board.height)]
 
-    # Conduct the search starting once from each square
-    for starting_square in all_squares:
-        traversed = []
+def write_distances(path, distances):
+    '''
+    Writes the distance array into file 'path'. The file is first written under a temporary name,
+    so that other processes never see a partially written file.
+    '''
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        distances.tofile(file)
+    os.replace(tmp_path, path)
+
+
+def evict_cache_files(cache_dir, max_bytes, keep):
+    '''
+    Removes the least recently used distance files from 'cache_dir' until the files take at most 'max_bytes'.
+    The files in 'keep' (the ones of the current map) are not removed.
+    '''
+    files = []
+    for path in pathlib.Path(cache_dir).glob('*.dist'):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue    # Removed by another process
+        files.append((stat.st_mtime, stat.st_size, str(path)))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass        # In use or already removed
+
+
+def open_distances(path, n):
+    '''
+    Memory-maps the distance file 'path' for a board of n squares, and returns it as a read-only sequence
+    of signed shorts. Raises ValueError if the file has the wrong size.
+    '''
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size != 2 * n * n:
+            raise ValueError(f"Distance cache file {path} has the wrong size")
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast('h')
+
 
-        # Format of q: (square, distance), where 'square' is the coordinates (x,y) and 'distance' is the number
-        # of steps from 'starting_square' to 'square'.
-        q = queue.Queue()
-        q.put((starting_square,0))
+def calculate_neighbours(width, height):
+    '''
+    Returns a list where item i is a tuple of the ids of the (at most four) squares next to square id i.
+    '''
+    neighbours = []
+    for y in range(height):
+        for x in range(width):
+            square_neighbours = []
+            for dx, dy in ((0,1),(1,0),(0,-1),(-1,0)):
+                if 0 <= x+dx < width and 0 <= y+dy < height:
+                    square_neighbours.append((y+dy)*width + x+dx)
+            neighbours.append(tuple(square_neighbours))
+    return neighbours
 
-        # Breadth-first search
-        while not q.empty():
-            curr_coord, curr_length = q.get()
 
-            # Update distances if needed
-            if distance_board[coord2str(starting_square)][coord2str(curr_coord)] is None or curr_length < distance_board[coord2str(starting_square)][coord2str(curr_coord)]:
-                distance_board[coord2str(starting_square)][coord2str(curr_coord)] = curr_length
+def calculate_passable(board, movement_skills=None):
+    '''
+    Returns a bytearray where item i is 1 if a character with the skills in 'movement_skills' can
+    move through square id i, and 0 otherwise.
+    '''
+    if movement_skills is None:
+        movement_skills = []
+    passable = bytearray(board.width * board.height)
+    for y in range(board.height):
+        for x in range(board.width):
+            tile_passable = board.get_terrain((x,y)).passable
+            if tile_passable == True:
+                passable[y*board.width + x] = 1
+            elif tile_passable != False and any([sk for sk in movement_skills if sk in tile_passable]):
+                passable[y*board.width + x] = 1
+    return passable
+
 
-            # Handle each neighbour of the current square
-            for direction in DIRECTIONS:
-                neighbour_coordinates = (curr_coord[0] + direction[0], curr_coord[1] + direction[1])
-                
-                # Out of bounds
-                if not 0 <= neighbour_coordinates[0] <= max_x or not 0 <= neighbour_coordinates[1] <= max_y:
-                    continue
+def calculate_distances(board, movement_skills=None, neighbours=None, passable=None):
+    '''
+    Function applies breadth-first search to find the distance of any two squares, when movement skills given in
+    list 'movement_skills' is applied.
+    Returns a flat array 'distances' of signed shorts, where
+        distances[id1*n + id2]
+    is the distance between squares with ids id1 and id2 (n being the number of squares), or UNREACHABLE.
+    '''
+    n = board.width * board.height
+    if neighbours is None:
+        neighbours = calculate_neighbours(board.width, board.height)
+    if passable is None:
+        passable = calculate_passable(board, movement_skills)
 
-                # Has already been traversed to 
-                if neighbour_coordinates in traversed:
-                    continue
+    distances = array('h', [UNREACHABLE]) * (n*n)
 
-                neighbour_tile = board.get_tile(neighbour_coordinates)
+    # Conduct the search starting once from each square
+    for source in range(n):
+        calculate_row(source, neighbours, passable, distances, offset=source*n)
 
-                # Cannot be traversed at all
-                if neighbour_tile.passable == False:
-                    continue
-                # Can be traversed but character does not have the needed skills
-                elif neighbour_tile.passable != True and not any([sk for sk in movement_skills if sk in neighbour_tile.passable]):
-                    continue
+    return distances
 
-                # If none of the previous apply, add this square to the queue
-                traversed.append(neighbour_coordinates)
-                q.put(( neighbour_coordinates, curr_length+1 ))
 
-    return distance_board
+def calculate_row(source, neighbours, passable, distances, offset=0):
+    '''
+    Function applies breadth-first search from square id 'source', and writes the distance to square id i
+    into distances[offset + i]. The written range must be initialized to UNREACHABLE.
+    '''
+    distances[offset + source] = 0
 
+    # Breadth-first search, one distance layer at a time
+    frontier = [source]
+    distance = 0
+    while frontier:
+        distance += 1
+        next_frontier = []
+        for square in frontier:
+            for neighbour in neighbours[square]:
+                if passable[neighbour] and distances[offset + neighbour] == UNREACHABLE:
+                    distances[offset + neighbour] = distance
+                    next_frontier.append(neighbour)
+        frontier = next_frontier
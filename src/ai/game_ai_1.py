@@ -3,7 +3,6 @@ Module has a set of AI functions to run.
 The logic in these functions is pretty much identical to the original game.
 '''
 
-import random
 import skill
 from game_enums import CharacterClass, PlayerColor
 from move import Move
@@ -22,7 +21,7 @@ def get_move(game, player_color: PlayerColor) -> Move:
             not_ready.append(char)
             
     size = len(not_ready)
-    next = random.randint(0,size-1)
+    next = game.rng.randint(0,size-1)
     char = not_ready[next]
     line = calculate_best_move(char)
 
@@ -131,7 +130,7 @@ def calculate_best_move(char):
     for action in possibilities:
         value += action[3]
         
-    i = random.randint(0,value-1)
+    i = char.game.rng.randint(0,value-1)
         
     for action in possibilities:
         i -= action[3]
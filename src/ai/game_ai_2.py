@@ -2,13 +2,11 @@
 Module has a set of AI functions to run.
 '''
 
-import random
 import skill
 from game_enums import CharacterClass, PlayerColor
 from game_errors import IllegalMoveException
 from move import Move, Value
 
-import copy
 import math
 import itertools
 
@@ -151,12 +149,14 @@ def get_move(game, player_color) -> Move:
     best_value = -math.inf
 
     for move in possible_moves:
-        game_copy = copy.deepcopy(game)
+        snapshot = game.snapshot()
         try:
-            apply_candidate_move(game_copy, move)
+            apply_candidate_move(game, move)
         except IllegalMoveException:
+            game.restore(snapshot)
             continue
-        value = get_heuristic_board_value(game_copy, player_color, enemy_threat_board)
+        value = get_heuristic_board_value(game, player_color, enemy_threat_board)
+        game.restore(snapshot)
         move.value = value
         if value.get() > best_value:
             best_move = move
@@ -267,7 +267,7 @@ def get_heuristic_board_value(game, player_color, enemy_threat_board):
     value -= ('Enemies close', 0.1 * (nof_player_characters/nof_enemy_characters) * sum([ PREFER_ENEMY_COMPANY[char.type]*distance_between_two_characters(char, enemy_char) / (nof_player_characters * nof_enemy_characters) for char in player.get_characters() for enemy_char in enemy.get_characters() ]) )
 
     # Add random noise
-    value += ('Noise', random.gauss(0, 0.3))
+    value += ('Noise', game.rng.gauss(0, 0.3))
 
     return value
 
@@ -2,13 +2,11 @@
 Module has a set of AI functions to run.
 '''
 
-import random
 import skill
 from game_enums import CharacterClass, PlayerColor
 from game_errors import IllegalMoveException
 from move import Move, Value
 
-import copy
 import math
 import statistics
 
@@ -150,12 +148,14 @@ def get_move(game, player_color) -> Move:
     best_value = -math.inf
 
     for move in possible_moves:
-        game_copy = copy.deepcopy(game)
+        snapshot = game.snapshot()
         try:
-            apply_candidate_move(game_copy, move)
+            apply_candidate_move(game, move)
         except IllegalMoveException:
+            game.restore(snapshot)
             continue
-        value = get_heuristic_board_value_3(game_copy, player_color)
+        value = get_heuristic_board_value_3(game, player_color)
+        game.restore(snapshot)
         move.value = value
         if value.get() > best_value:
             best_move = move
@@ -231,6 +231,6 @@ def get_heuristic_board_value_3(game, player_color):
     value -= ('Enemies close', avedist_enemies )
 
     # Add some randomness
-    value += ('Random', random.gauss(0,0.01) )
+    value += ('Random', game.rng.gauss(0,0.01) )
 
     return value
@@ -3,17 +3,41 @@ Module has a set of AI functions to run.
 These functions are curently deemed to be the best.
 '''
 
-import random
 import skill
 from game_enums import CharacterClass, PlayerColor, SkillType, Stats
 from move import Move, Value
 import game_errors
 
-import copy
+import concurrent.futures
 import math
-import random
+import pickle
 import statistics
-import itertools
+import time
+from attack import CombatTable
+from ai.threat import ThreatBoard
+import configload
+import zobrist
+
+# Cache of heuristic values and search results, keyed by Zobrist hashes of the game state (None if disabled)
+transposition_table_size = configload.get_setting('ai', 'transposition_table_size', 100000)
+transposition_table = zobrist.TranspositionTable(transposition_table_size) if transposition_table_size > 0 else None
+
+# Damage and accuracy of attacks in the current turn
+combat_table = CombatTable()
+
+# Process pools used to evaluate candidate moves in parallel, by the number of workers
+worker_pools = {}
+
+
+def reset_caches():
+    '''
+    Empties the transposition table and the combat table. Called when a new match starts (see simulate.play_game
+    and GUI.init_game): results cached during an earlier game would change the AI's decisions and the random numbers
+    it draws, so the same seed would not replay the same game in the same process.
+    '''
+    if transposition_table is not None:
+        transposition_table.clear()
+    combat_table.clear()
 
 # Priority: which characters move first
 PRIORITY = {
@@ -127,10 +151,14 @@ ADVANTAGES = {
     },
 }
 
-def get_move(game, player_color) -> Move:
+def get_move(game, player_color, workers=None, seed=None, stats=None, control=None) -> Move:
     '''
     Generates and returns a move to be executed.
+    See get_best_move_for_character for the parameters 'workers' and 'seed'.
+    @param stats:   ai.search.SearchStats to which the number of evaluated moves and the time used are added (optional)
+    @param control: ai.search.SearchControl which can stop the evaluation by raising SearchAborted (optional)
     '''
+    start = time.perf_counter()
     player = game.get_player(player_color)
     #enemy = game.get_blue_player() if player_color == PlayerColor.RED else game.get_red_player()
     
@@ -139,74 +167,170 @@ def get_move(game, player_color) -> Move:
         return
 
     # Sort the characters by priority, but add a bit of randomness
-    chars.sort(key=lambda c: PRIORITY[c.type] + random.gauss(0,0.1))
+    chars.sort(key=lambda c: PRIORITY[c.type] + game.rng.gauss(0,0.1))
     char = chars[0]
 
     # Calculate and return the best move for the chosen character
-    return get_best_move_for_character(game, char, player_color)
+    move = get_best_move_for_character(game, char, player_color, workers=workers, seed=seed, stats=stats, control=control)
+    if stats is not None:
+        stats.depth  = max(stats.depth, 1)
+        stats.moves += 1
+        stats.time  += time.perf_counter() - start
+    return move
 
 
-def get_best_move_for_character(game, char, player_color):
+def get_best_move_for_character(game, char, player_color, workers=None, seed=None, stats=None, control=None):
     '''
     Calculates and returns the best move the character can do.
+    @param workers: Number of processes the candidate moves are evaluated in. If 1, they are evaluated in this process.
+                    Defaults to the setting 'workers' in section 'ai' of the config file.
+    @param seed:    If given, the random numbers used when evaluating a candidate move are seeded from it and the
+                    index of the candidate, so that the result does not depend on the number of workers.
+    @param stats:   ai.search.SearchStats to which the number of evaluated moves is added (optional)
+    @param control: ai.search.SearchControl which is checked before each candidate move is evaluated (optional).
+                    In the process pool mode it is checked only after all candidates have been evaluated.
     '''
     player = game.get_player(player_color)
     enemy = game.get_blue_player() if player_color == PlayerColor.RED else game.get_red_player()
+    if workers is None:
+        workers = configload.get_setting('ai', 'workers', 1)
 
     # Compute the threat boards for both player and their enemy
+    combat_table.new_turn(game.get_turn_key())
     player_threat_board = construct_player_threat_board(game, player)
     enemy_threat_board  = construct_player_threat_board(game, enemy)
 
-    # Set up the tmp stats used by the heuristics function
+    # Generate all candidate moves and evaluate them
     original_square = char.get_square()
-    prepare_game_copy(game)
-
-    # Initialize the current best move
+    candidates = list(enumerate(get_candidate_moves(game, char)))
+    if workers > 1:
+        # The workers do not share the game's random state, so they must always be seeded
+        if seed is None:
+            seed = game.rng.getrandbits(64)
+        results = evaluate_candidates_in_pool(game, char, candidates, player.color, player_threat_board, enemy_threat_board, workers, seed)
+        if control is not None:
+            control.check()
+    else:
+        results = evaluate_candidates(game, char, candidates, player.color, player_threat_board, enemy_threat_board, seed, control)
+    if stats is not None:
+        stats.nodes += len(results)
+
+    # Find the best move. On equal values the candidate generated first is chosen.
     best_move, best_value = None, -math.inf
+    for index, value, target_square in results:
+        move = candidates[index][1]
+        move.value, move.target_square = value, target_square
+        if move.value.get() > best_value:
+            best_move, best_value = move, move.value.get()
+
+    # Determine that the character needs to be moved from its original square
+    best_move.source_square = original_square
+
+    # Return best move
+    return best_move
+
+
+def get_candidate_moves(game, char):
+    '''
+    Returns a list of all moves the character can do this turn, excluding redundant ones: moving to each legal square,
+    and from there each attack and skill on each of their targets. The last move is staying in the original square
+    and passing the turn, which Board.move_char allows even when the character has no legal squares, so that there
+    is always at least one candidate.
+    '''
+    candidates = []
+    original_square = char.get_square()
 
     # Loop through all possible squares and generate the all possible moves
     for square in char.get_legal_squares():
 
         # Move to the square in question
-        move = Move( char.get_square(), square, None, 'p', None )
-        move.value = apply_candidate_move(game, char, move, player.color, player_threat_board, enemy_threat_board)
-        if move.value.get() > best_value:
-            best_move, best_value = move, move.value.get()
+        candidates.append( Move( original_square, square, None, 'p', None ) )
 
-        # Check value for each attack from this square
+        # Each attack from this square
         attack_targets = [(target_square, att.type) for att in char.get_attacks() for target_square in char.define_attack_targets(square, att.get_range()[1], True) ]
         for attack_target, attack_type in attack_targets:
-            move = Move( char.get_square(), square, attack_target, 'a', attack_type )
-            if is_redundant_move(game, char, move):
-                continue
-            move.value = apply_candidate_move(game, char, move, player.color, player_threat_board, enemy_threat_board)
-            if move.value.get() > best_value:
-                best_move, best_value = move, move.value.get()
+            move = Move( original_square, square, attack_target, 'a', attack_type )
+            if not is_redundant_move(game, char, move):
+                candidates.append(move)
 
-        # Check value for each skill from this square
+        # Each skill from this square
         activated_skills = [sk for sk in char.get_full_skills() if sk.type in skill.Skill.active_skills]
         skill_targets  = [(target_square, sk.type) for sk in activated_skills for target_square in char.define_attack_targets(square, sk.get_range(), sk.targets_enemy()) ]
         for skill_target, skill_type in skill_targets:
-            move = Move( char.get_square(), square, skill_target, 's', skill_type )
-            if is_redundant_move(game, char, move):
-                continue
-            move.value = apply_candidate_move(game, char, move, player.color, player_threat_board, enemy_threat_board)
-            if move.value.get() > best_value:
-                best_move, best_value = move, move.value.get()
-    
-    # Move back to original square and check its value
-    # This should be applicable even without any legal moves -> should always be at least one legal move (passing the turn)
-    move = Move( char.get_square(), original_square, None, 'p', None )
-    move.value = apply_candidate_move(game, char, move, player.color, player_threat_board, enemy_threat_board)
-    if move.value.get() > best_value:
-        best_move, best_value = move, move.value.get()
-
-    # Because of the logic used, the character's source square in Move can be pretty much any square.
-    # Thus, determine that it needs to be moved from its original square
-    best_move.source_square = original_square
+            move = Move( original_square, square, skill_target, 's', skill_type )
+            if not is_redundant_move(game, char, move):
+                candidates.append(move)
 
-    # Return best move
-    return best_move
+    # Stay in the original square
+    candidates.append( Move( original_square, original_square, None, 'p', None ) )
+    return candidates
+
+
+def evaluate_candidates(game, char, candidates, player_color, player_threat_board, enemy_threat_board, seed=None, control=None):
+    '''
+    Evaluates the candidate moves, given as a list of (index, move) pairs, with apply_candidate_move.
+    If 'seed' is given, the game's random number generator is seeded before each move from the seed and the move's index,
+    and its earlier state is restored afterwards. If 'control' (ai.search.SearchControl) is given, it is checked
+    before each move, and may stop the evaluation by raising ai.search.SearchAborted; the progress is reported to it
+    after each move.
+    Returns a list of tuples (index, value, target square), as the target square of a skill may be changed on evaluation.
+    The threat boards must be those of the current state of the game, as its hash is used as the context of the
+    cached heuristic values.
+    '''
+    results = []
+    random_state = game.rng.getstate() if seed is not None else None
+    prepare_game_copy(game)
+    context = game.get_hash()
+    try:
+        for index, move in candidates:
+            if control is not None:
+                control.check()
+            if seed is not None:
+                game.rng.seed(f"{seed}:{index}")
+            value = apply_candidate_move(game, char, move, player_color, player_threat_board, enemy_threat_board, context)
+            results.append((index, value, move.target_square))
+            if control is not None:
+                control.report_progress(len(results), len(candidates))
+    finally:
+        release_game_copy(game)
+        if random_state is not None:
+            game.rng.setstate(random_state)
+    return results
+
+
+def evaluate_candidates_in_pool(game, char, candidates, player_color, player_threat_board, enemy_threat_board, workers, seed):
+    '''
+    Same as evaluate_candidates, but the candidates are divided between a pool of 'workers' processes.
+    The game is serialized once, and each worker gets it together with its share of the candidates.
+    '''
+    state  = pickle.dumps((game, char.get_square(), player_color, player_threat_board, enemy_threat_board), pickle.HIGHEST_PROTOCOL)
+    pool   = get_worker_pool(workers)
+    shares = [candidates[i::workers] for i in range(workers) if candidates[i::workers]]
+    futures = [pool.submit(evaluate_candidates_in_worker, state, share, seed) for share in shares]
+    results = [result for future in futures for result in future.result()]
+    results.sort(key=lambda result: result[0])
+    return results
+
+
+def evaluate_candidates_in_worker(state, candidates, seed):
+    '''
+    Run in a worker process: deserializes the game made by evaluate_candidates_in_pool and evaluates the candidates in it.
+    The worker's combat table is emptied when the task belongs to another turn than the previous one.
+    '''
+    game, char_square, player_color, player_threat_board, enemy_threat_board = pickle.loads(state)
+    combat_table.new_turn(game.get_turn_key())
+    char = game.board.get_piece(char_square)
+    return evaluate_candidates(game, char, candidates, player_color, player_threat_board, enemy_threat_board, seed)
+
+
+def get_worker_pool(workers):
+    '''
+    Returns a process pool with the given number of workers. The pools are kept for later turns; the caches of
+    a worker are emptied when it starts.
+    '''
+    if workers not in worker_pools:
+        worker_pools[workers] = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=reset_caches)
+    return worker_pools[workers]
 
 
 def is_redundant_move(game, char, move):
@@ -218,8 +342,8 @@ def is_redundant_move(game, char, move):
     if move.action_type == 'a':
         attack      = char.get_attack_by_id(move.action_id)
         target_char = game.board.get_piece(move.target_square)
-        max_dmg     = attack.calculate_max_damage(target_char)
-        accuracy    = attack.calculate_accuracy(target_char)
+        max_dmg     = combat_table.max_damage(attack, target_char)
+        accuracy    = combat_table.accuracy(attack, target_char)
         # Skip if can't deal any damage
         if max_dmg <= 0:
             return True
@@ -229,8 +353,8 @@ def is_redundant_move(game, char, move):
             other_attack_max_range  = other_attack.get_range()[1]
             if abs(char.get_square()[0]-target_char.get_square()[0]) + abs(char.get_square()[1]-target_char.get_square()[1]) > other_attack_max_range:
                 continue
-            other_attack_accuracy   = attack.calculate_accuracy(target_char)
-            other_attack_max_damage = attack.calculate_max_damage(target_char)
+            other_attack_accuracy   = combat_table.accuracy(attack, target_char)
+            other_attack_max_damage = combat_table.max_damage(attack, target_char)
             # Skip if there is another, strictly better attack for this situation
             if other_attack_accuracy > accuracy and other_attack_max_damage >= max_dmg:
                 return True
@@ -258,13 +382,14 @@ def is_redundant_move(game, char, move):
     return False
 
 
-def apply_candidate_move(game, char, move, player_color, player_threat_board, enemy_threat_board):
+def apply_candidate_move(game, char, move, player_color, player_threat_board, enemy_threat_board, context=None):
     '''
     Function applies the given move, but has a few key differences to game.apply_move:
     - All changes to HP is made to char.tmp_hp rather than char.hp, meaning that characters cannot die even if their (tmp) hp would drop to zero
     - Heuristic value of the board state after the action is calculated and returned
     - All changes to stats and tmp_hp are reseted afterwards
     - Character is moved back to the original square afterwards.
+    See get_heuristic_board_value for 'context'.
     '''
     #reset_tmp_stats(game)
     value = None
@@ -285,7 +410,7 @@ def apply_candidate_move(game, char, move, player_color, player_threat_board, en
         target_char.remove_hp(damage, verbose=False)
         #if miss <= accuracy:
         #    calculate_tmp_hp(target_char, -dmg)
-        accuracy    = attack.calculate_accuracy(target_char)
+        accuracy    = combat_table.accuracy(attack, target_char)
         bonus_value += accuracy/100
 
     # Skill
@@ -299,12 +424,13 @@ def apply_candidate_move(game, char, move, player_color, player_threat_board, en
         try:
             sk.use(move.target_square, verbose=False)
         except game_errors.IllegalMoveException:
+            game.board.move_char(char, move.source_square, verbose=False)
             reset_game_copy(game)
             value = Value("Illegal move", -math.inf)
             return value
     
     # Calculate the heuristic value
-    value = get_heuristic_board_value(game, char, player_color, player_threat_board, enemy_threat_board)
+    value = get_heuristic_board_value(game, char, player_color, player_threat_board, enemy_threat_board, context)
     value += ("Bonus value", bonus_value)
 
     # Move back to original square and reset temporary stats
@@ -313,9 +439,36 @@ def apply_candidate_move(game, char, move, player_color, player_threat_board, en
     return value
 
 
-def get_heuristic_board_value(game, moven_char, player_color, player_threat_board, enemy_threat_board):
+def get_heuristic_board_value(game, moven_char, player_color, player_threat_board, enemy_threat_board, context=None):
     '''
     Returns a heuristically determined value of how good a given board situation is to a player.
+    If 'context' is given, the value is cached in the transposition table, keyed by the context, the hash of the game
+    and the moven character's square. The context must identify the state the threat boards were constructed in,
+    e.g. its hash. The random part of the value is added anew on every call.
+    '''
+    key = None
+    value = None
+    if context is not None and transposition_table is not None:
+        key = (context, game.get_hash(), moven_char.get_square(), player_color)
+        sections = transposition_table.get(key)
+        if sections is not None:
+            value = Value()
+            value.sections = [list(section) for section in sections]
+    if value is None:
+        value = calculate_heuristic_board_value(game, moven_char, player_color, player_threat_board, enemy_threat_board)
+        if key is not None:
+            transposition_table.put(key, [list(section) for section in value.sections])
+
+    # Add some randomness, unless the game has been determined
+    if get_winner(game) is None:
+        value += ('Random', game.rng.gauss(0,0.01) )
+
+    return value
+
+
+def calculate_heuristic_board_value(game, moven_char, player_color, player_threat_board, enemy_threat_board):
+    '''
+    Calculates the value for get_heuristic_board_value, without the random part.
     '''
     value = Value()
 
@@ -396,29 +549,14 @@ def get_heuristic_board_value(game, moven_char, player_color, player_threat_boar
 
     value -= ("Dangerous squares", danger_value )
 
-    # Add some randomness
-    value += ('Random', random.gauss(0,0.01) )
-
     return value
 
 
 def construct_player_threat_board(game, player):
     '''
-    Function constructs a 2D-board showing where the characters can attack to this turn and with which attacks.
+    Function constructs a ThreatBoard showing where the characters can attack to this turn and with which attacks.
     '''
-    board = [[[] for col in range(game.board.width)] for row in range(game.board.height) ]
-    # Loop through all characters
-    for char in player.get_characters():
-        legal_movement_squares = char.get_legal_squares()
-        all_attacks = char.get_attacks()
-        # Loop through all attacks this character has
-        for square, attack in itertools.product(legal_movement_squares, all_attacks):
-            attack_range = attack.get_range()[1]
-            attack_squares = game.board.get_tiles_in_range(square, attack_range)
-            # Add the attack to the board
-            for attack_square in attack_squares:
-                board[attack_square[1]][attack_square[0]].append([char.get_square(), attack.type])
-    return board
+    return ThreatBoard(game.board, player)
 
 
 def get_max_enemy_damage(game, threat_board, char, disregard_moven=False):
@@ -427,8 +565,7 @@ def get_max_enemy_damage(game, threat_board, char, disregard_moven=False):
     based on the player threat board.
     Disregard moven: do not count possible damage from characters that have already ended their turn.
     '''
-    coordinates = char.get_square()
-    all_attacks = threat_board[coordinates[1]][coordinates[0]]
+    all_attacks = threat_board.attacks_at(char.get_square())
     char_attack = {}
     for enemy_char_square, attack_id in all_attacks:
         enemy_char = game.board.get_piece(enemy_char_square)
@@ -439,7 +576,7 @@ def get_max_enemy_damage(game, threat_board, char, disregard_moven=False):
         if disregard_moven and enemy_char.is_ready():
             continue
         attack = enemy_char.get_attack_by_id(attack_id)
-        dmg = attack.calculate_max_damage(char)
+        dmg = combat_table.max_damage(attack, char)
         if enemy_char not in char_attack or dmg > char_attack[enemy_char]:
             char_attack[enemy_char] = dmg
     return char_attack
@@ -451,8 +588,7 @@ def get_probable_enemy_damage(game, threat_board, char, disregard_moven=False):
     based on the player threat board.
     Disregard moven: do not count possible damage from characters that have already ended their turn.
     '''
-    coordinates = char.get_square()
-    all_attacks = threat_board[coordinates[1]][coordinates[0]]
+    all_attacks = threat_board.attacks_at(char.get_square())
     char_attack = {}
     for enemy_char_square, attack_id in all_attacks:
         enemy_char = game.board.get_piece(enemy_char_square)
@@ -463,7 +599,7 @@ def get_probable_enemy_damage(game, threat_board, char, disregard_moven=False):
         if disregard_moven and enemy_char.is_ready():
             continue
         attack = enemy_char.get_attack_by_id(attack_id)
-        dmg = attack.calculate_probable_damage(char)
+        dmg = combat_table.probable_damage(attack, char)
         if enemy_char not in char_attack or dmg > char_attack[enemy_char]:
             char_attack[enemy_char] = dmg
     return char_attack
@@ -481,6 +617,7 @@ def prepare_game_copy(game):
             if self.char.hp < 0:
                 self.char.hp = 0
             self.char.alive = False
+            self.char.update_hash()
             
     for char in game.get_blue_player().get_characters() + game.get_red_player().get_characters():
         char.original_hp        = char.hp
@@ -490,6 +627,19 @@ def prepare_game_copy(game):
         tmp_handler = TmpGameHandler(char)
         char.die = tmp_handler.die_dummy
 
+def release_game_copy(game):
+    '''
+    Undoes the changes 'prepare_game_copy' made to the characters, so that the game can be played on normally.
+    Characters' state must have been reset with 'reset_game_copy' first.
+    '''
+    for char in game.get_blue_player().get_characters() + game.get_red_player().get_characters():
+        if 'die' in char.__dict__:
+            del char.die
+        for attr in ('original_hp', 'original_skills', 'original_ready', 'original_alive'):
+            if attr in char.__dict__:
+                delattr(char, attr)
+
+
 def reset_game_copy(game):
     '''
     Resets the given game copy to its original state. The 'prepare_game_copy' function must have been called earlier.
@@ -499,6 +649,8 @@ def reset_game_copy(game):
         char.skills    = list(char.original_skills)
         char.ready     = char.original_ready
         char.alive     = char.original_alive
+        char.invalidate_stats()
+        char.update_hash()
 
 
 def get_winner(game):
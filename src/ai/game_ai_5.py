@@ -0,0 +1,198 @@
+'''
+Module has an AI function which searches several character moves ahead with alpha-beta pruning.
+The board states are evaluated with the heuristics of game_ai_4.
+
+One ply of the search is one character's move. The characters of a player move one after another in the
+order of game_ai_4.PRIORITY, and when all of them are ready the turn changes to the other player, so that
+the searched lines run over whole player turns. By default the search is as deep as the number of the player's
+characters which have not yet moved plus REPLY_DEPTH, so that the opponent's reply to the player's turn is
+searched, but at most MAX_DEFAULT_DEPTH.
+
+Every candidate move of the character is searched, best first in the order of their heuristic values, and alpha-beta
+pruning skips the moves which cannot change the result. The best move found earlier for the same state in the
+transposition table is searched first. A beam width can be given to search only the best moves of each state
+(forward pruning), which is faster but can miss the best line.
+'''
+
+from game_enums import PlayerColor
+from move import Move, Value
+import ai.game_ai_4 as game_ai_4
+
+import math
+import time
+
+
+# Number of the opponent's character moves searched after the player's turn when the depth is not given
+REPLY_DEPTH = 1
+
+# Largest depth used when the depth is not given. The moves of one player's turn cannot prune each other, so the
+# time grows exponentially with the depth; deeper searches are done within a time budget with ai.search.make_ai_func.
+MAX_DEFAULT_DEPTH = 2
+
+# Kinds of values stored in the transposition table: the exact value, or a lower or an upper bound of it
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+def get_move(game, player_color, depth=None, beam_width=None, stats=None, control=None) -> Move:
+    '''
+    Generates and returns a move to be executed.
+    @param depth:      How many character moves ahead are searched. Defaults to default_depth(game, player_color).
+    @param beam_width: How many of the best moves of each state are searched deeper, at least 2, or None to search all
+    @param stats:      ai.search.SearchStats to which the number of searched nodes and the time used are added (optional)
+    @param control:    ai.search.SearchControl which can stop the search by raising SearchAborted (optional).
+                       The game is left in its original state also then.
+    '''
+    start = time.perf_counter()
+    if next_character(game, player_color) is None:
+        return
+    if depth is None:
+        depth = default_depth(game, player_color)
+    if beam_width is not None and beam_width < 2:
+        raise ValueError(f"Beam width {beam_width} would search only the heuristically best line, use at least 2")
+
+    game_ai_4.combat_table.new_turn(game.get_turn_key())
+    seed = game.rng.getrandbits(64)
+    value, move = search_as_ai(game, depth, beam_width, stats, control, seed)
+    move.value = Value('Search', value)
+
+    if stats is not None:
+        stats.depth  = max(stats.depth, depth)
+        stats.moves += 1
+        stats.time  += time.perf_counter() - start
+    return move
+
+
+def default_depth(game, player_color):
+    '''
+    Returns the depth which searches the rest of the player's turn and REPLY_DEPTH moves of the opponent,
+    but at most MAX_DEFAULT_DEPTH.
+    '''
+    remaining = [char for char in game.get_player(player_color).get_characters() if not char.is_ready()]
+    return min(len(remaining) + REPLY_DEPTH, MAX_DEFAULT_DEPTH)
+
+
+def search_as_ai(game, depth, beam_width=None, stats=None, control=None, seed=None):
+    '''
+    Runs the search with both players marked as AI controlled, so that the moves of a human player's
+    characters can be applied without asking for a confirmation. The players are restored afterwards.
+    '''
+    ai_controlled = {player: player.ai for player in game.players.values()}
+    try:
+        for player in ai_controlled:
+            player.ai = True
+        return search(game, depth, -math.inf, math.inf, beam_width, stats, control, seed, root=True)
+    finally:
+        for player, ai in ai_controlled.items():
+            player.ai = ai
+
+
+def move_key(move):
+    '''
+    Returns a tuple which identifies the move among the candidate moves of a state.
+    '''
+    return (move.source_square, move.destination_square, move.target_square, move.action_type, move.action_id)
+
+
+def search(game, depth, alpha, beta, beam_width=None, stats=None, control=None, seed=None, root=False):
+    '''
+    Alpha-beta search from the current state of the game.
+    The values are from the point of view of the player whose turn it is, and a value from the next state
+    is negated if the turn changes there.
+    The results are stored in game_ai_4's transposition table as tuples (value, bound, depth, key of the best move),
+    and reused when the same state is searched again at the same or a smaller depth.
+    @param beam_width: How many of the best moves of each state are searched deeper, or None to search all of them
+    @param seed:       If given, the random numbers of each state (the random part of the heuristic values and the hit
+                       rolls) are drawn from the seed and the state's hash, so that the values do not depend on which
+                       states were searched before
+    @param root:       True if the move is needed: a stored value is then not used instead of searching
+    @return: Tuple (value, move), where move is the first move of the best line found, or None if the value was
+             taken from the transposition table
+    '''
+    if control is not None:
+        control.check()
+
+    # Use an earlier result for this state if it is good enough, and otherwise search its best move first
+    table = game_ai_4.transposition_table
+    key, best_key = None, None
+    if table is not None:
+        key = ('search', game.get_hash(), beam_width)
+        entry = table.get(key)
+        if entry is not None:
+            value, bound, entry_depth, best_key = entry
+            if not root and entry_depth >= depth and \
+                    (bound == EXACT or (bound == LOWER and value >= beta) or (bound == UPPER and value <= alpha)):
+                return value, None
+    original_alpha = alpha
+    player_color = game.whose_turn
+    char = next_character(game, player_color)
+    player = game.get_player(player_color)
+    enemy = game.get_blue_player() if player_color == PlayerColor.RED else game.get_red_player()
+
+    # Evaluate every candidate move of the character, and order them from the best to the worst
+    player_threat_board = game_ai_4.construct_player_threat_board(game, player)
+    enemy_threat_board  = game_ai_4.construct_player_threat_board(game, enemy)
+    candidates = list(enumerate(game_ai_4.get_candidate_moves(game, char)))
+    state_seed = None if seed is None else f"{seed}:{game.get_hash()}"
+    for index, value, target_square in game_ai_4.evaluate_candidates(game, char, candidates, player_color, player_threat_board, enemy_threat_board, state_seed, control):
+        move = candidates[index][1]
+        move.value, move.target_square = value, target_square
+    moves = sorted([move for index, move in candidates], key=lambda move: (move_key(move) != best_key, -move.value.get()))
+    if stats is not None:
+        stats.nodes += len(moves) + 1
+
+    # Last ply: the heuristic values are used as such
+    if depth <= 1:
+        best_move = max(moves, key=lambda move: move.value.get())
+        if key is not None:
+            table.put(key, (best_move.value.get(), EXACT, depth, move_key(best_move)))
+        return best_move.value.get(), best_move
+
+    if beam_width is not None:
+        moves = moves[:beam_width]
+    best_move, best_value = None, -math.inf
+    for move in moves:
+        value = move.value.get()
+
+        # Search deeper, unless the game is already determined (or the move was illegal). The hit rolls of the move
+        # are drawn from the seed, and do not use up the game's random numbers.
+        if not math.isinf(value):
+            random_state = game.rng.getstate()
+            if seed is not None:
+                game.rng.seed(f"{state_seed}:{move_key(move)}")
+            undo = game.make_move(move, verbose=False)
+            try:
+                if not game.is_game_over():
+                    if game.is_player_ready():
+                        game.change_turn(verbose=False)
+                    if game.whose_turn == player_color:
+                        value, _ = search(game, depth-1, alpha, beta, beam_width, stats, control, seed)
+                    else:
+                        value, _ = search(game, depth-1, -beta, -alpha, beam_width, stats, control, seed)
+                        value = -value
+            finally:
+                game.unmake_move(undo)
+                game.rng.setstate(random_state)
+
+        if best_move is None or value > best_value:
+            best_move, best_value = move, value
+        alpha = max(alpha, value)
+        if alpha >= beta:
+            if stats is not None:
+                stats.cutoffs += 1
+            break
+
+    if key is not None:
+        bound = UPPER if best_value <= original_alpha else LOWER if best_value >= beta else EXACT
+        table.put(key, (best_value, bound, depth, move_key(best_move)))
+    return best_value, best_move
+
+
+def next_character(game, player_color):
+    '''
+    Returns the character of the player which moves next, i.e. the character not yet ready with the
+    lowest priority in game_ai_4.PRIORITY, or None if all characters are ready.
+    '''
+    chars = [char for char in game.get_player(player_color).get_characters() if not char.is_ready()]
+    if len(chars) == 0:
+        return None
+    return min(chars, key=lambda c: game_ai_4.PRIORITY[c.type])
@@ -0,0 +1,163 @@
+'''
+Helpers shared by the searching AI functions: search statistics, and an anytime driver which deepens
+a search iteratively within a time budget.
+'''
+import inspect
+import time
+
+from move import Move
+
+
+class SearchStats:
+    '''
+    Counts the work an AI function does, so that different AIs can be compared.
+    A node is one board state the AI has evaluated or expanded.
+    Give the same object to several get_move calls to get the totals over them.
+    '''
+    def __init__(self) -> None:
+        self.nodes      = 0     # Board states evaluated or expanded
+        self.cutoffs    = 0     # Alpha-beta cutoffs
+        self.depth      = 0     # Deepest search depth reached, in character moves
+        self.moves      = 0     # Number of get_move calls
+        self.time       = 0.0   # Total time used, in seconds
+
+    def nodes_per_second(self):
+        '''
+        Returns the number of nodes searched per second, or 0 if no time has been recorded.
+        '''
+        if self.time <= 0:
+            return 0
+        return self.nodes / self.time
+
+    def __repr__(self) -> str:
+        return f"Nodes: {self.nodes}, nodes/s: {round(self.nodes_per_second())}, depth: {self.depth}, cutoffs: {self.cutoffs}, moves: {self.moves}, time: {round(self.time,2)} s"
+
+
+class SearchAborted(Exception):
+    '''
+    Raised by SearchControl.check when the search has to stop.
+    '''
+
+
+class SearchControl:
+    '''
+    Tells a running search when to stop: when its time budget runs out, or when it has been cancelled.
+    Searches call check() regularly; it raises SearchAborted when the search should stop.
+    '''
+    def __init__(self, budget=None, on_progress=None) -> None:
+        '''
+        @param budget:      Time budget in seconds, or None for no time limit
+        @param on_progress: Function called with the number of evaluated moves and the number of all moves to
+                            evaluate whenever a search reports its progress (optional)
+        '''
+        self.start       = time.perf_counter()
+        self.deadline    = None if budget is None else self.start + budget
+        self.cancelled   = False
+        self.on_progress = on_progress
+
+    def cancel(self):
+        self.cancelled = True
+
+    def limit(self, budget):
+        '''
+        Stops the search at the latest 'budget' seconds from now, or at the earlier deadline it already has.
+        '''
+        deadline = time.perf_counter() + budget
+        if self.deadline is None or deadline < self.deadline:
+            self.deadline = deadline
+
+    def is_stopped(self):
+        '''
+        Returns True if the search has been cancelled or its time has run out.
+        '''
+        return self.cancelled or (self.deadline is not None and time.perf_counter() >= self.deadline)
+
+    def check(self):
+        '''
+        Raises SearchAborted if the search should stop.
+        '''
+        if self.is_stopped():
+            raise SearchAborted()
+
+    def report_progress(self, done, total):
+        '''
+        Called by the searches when they have evaluated 'done' of their 'total' moves.
+        '''
+        if self.on_progress is not None:
+            self.on_progress(done, total)
+
+
+def accepts_argument(func, name):
+    '''
+    Returns True if the function accepts the keyword argument 'name'.
+    '''
+    return name in inspect.signature(func).parameters
+
+
+def iterative_deepening(game, player_color, ai_func, budget, max_depth=20, stats=None, control=None, **kwargs):
+    '''
+    Anytime search: calls 'ai_func' with search depths 1, 2, 3, ... until the time budget runs out or 'max_depth'
+    is reached, and returns the move of the deepest search that was completed.
+    'ai_func' is a get_move-style function. It is given the keyword arguments 'depth', 'control' and 'stats'
+    if it accepts them; a function without 'depth' is called once. A function without 'control' cannot be
+    stopped, and runs until it is done.
+    Before the first search is completed, the best move is passing the turn with the first character not yet ready,
+    so a move is always available.
+    The state of the game is restored if a search is stopped in the middle.
+    @param budget:  Time budget in seconds, or None for no time limit
+    @param stats:   SearchStats to which the nodes of all searches, the depth of the deepest completed search and
+                    the total time are added (optional)
+    @param control: SearchControl to use instead of a new one, e.g. to cancel the search from elsewhere. The budget
+                    is applied to it as well.
+    @param kwargs:  Other keyword arguments for 'ai_func'
+    @return: The best move found, or None if the player has no characters to move
+    '''
+    if control is None:
+        control = SearchControl(budget)
+    elif budget is not None:
+        control.limit(budget)
+    chars = [char for char in game.get_player(player_color).get_characters() if not char.is_ready()]
+    if len(chars) == 0:
+        return None
+    best_move = Move( chars[0].get_square(), chars[0].get_square(), None, 'p', None )
+
+    parameters = inspect.signature(ai_func).parameters
+    search_stats = SearchStats()
+    if 'control' in parameters:
+        kwargs['control'] = control
+    if 'stats' in parameters:
+        kwargs['stats'] = search_stats
+
+    depth_reached = 0
+    for depth in range(1, max_depth+1 if 'depth' in parameters else 2):
+        if 'depth' in parameters:
+            kwargs['depth'] = depth
+        snapshot = game.snapshot()
+        try:
+            move = ai_func(game, player_color, **kwargs)
+        except SearchAborted:
+            game.restore(snapshot)
+            break
+        if move is not None:
+            best_move, depth_reached = move, depth
+        if control.is_stopped():
+            break
+
+    if stats is not None:
+        stats.nodes     += search_stats.nodes
+        stats.cutoffs   += search_stats.cutoffs
+        stats.depth      = max(stats.depth, depth_reached)
+        stats.moves     += 1
+        stats.time      += time.perf_counter() - control.start
+    return best_move
+
+
+def make_ai_func(ai_func, budget, **kwargs):
+    '''
+    Returns a function which can be used as player.AI.ai_func, and which runs 'ai_func' with iterative_deepening
+    using the given time budget (in seconds) and other keyword arguments. A SearchControl given to the function
+    (see Game.ai_get_move) is passed on, so that the search can also be cancelled.
+    '''
+    def anytime_ai_func(game, player_color, control=None):
+        return iterative_deepening(game, player_color, ai_func, budget, control=control, **kwargs)
+    return anytime_ai_func
@@ -0,0 +1,71 @@
+'''
+Threat boards: where the characters of a player can attack to this turn, and with which attacks.
+'''
+import numpy as np
+
+
+class ThreatBoard:
+    '''
+    Class stores one boolean layer for each (character, attack) pair of a player. A layer tells which squares the
+    character can attack with the attack this turn, i.e. the squares within the attack's range from a square the
+    character can move to. The layers are in the order of the player's characters and their attacks.
+    '''
+    def __init__(self, board, player) -> None:
+        self.width  = board.width
+        self.height = board.height
+        self.sources = []   # Layer index -> (square of the attacking character, attack type)
+        layers = []
+
+        for char in player.get_characters():
+            reachable = np.zeros((self.height, self.width), dtype=bool)
+            for x, y in char.get_legal_squares():
+                reachable[y, x] = True
+            # Dilate the reachable squares one step at a time, in the order of the attacks' ranges
+            attacks = sorted(char.get_attacks(), key=lambda attack: attack.get_range()[1])
+            layer, radius = reachable, 0
+            by_type = {}
+            for attack in attacks:
+                while radius < attack.get_range()[1]:
+                    layer = dilate(layer)
+                    radius += 1
+                by_type[attack.type] = layer
+            for attack in char.get_attacks():
+                layers.append(by_type[attack.type])
+                self.sources.append((char.get_square(), attack.type))
+
+        if len(layers) > 0:
+            self.layers = np.stack(layers, axis=-1)     # Shape (height, width, number of layers)
+        else:
+            self.layers = np.zeros((self.height, self.width, 0), dtype=bool)
+        self.found = {}     # Square -> result of attacks_at
+
+    def attacks_at(self, square):
+        '''
+        Returns a list of (square of the attacking character, attack type) for each attack that can reach the given
+        square this turn. Each (character, attack) pair is listed once.
+        @param square: Coordinates in format (x,y)
+        '''
+        attacks = self.found.get(square)
+        if attacks is None:
+            attacks = [ self.sources[i] for i in np.flatnonzero(self.layers[square[1], square[0]]) ]
+            self.found[square] = attacks
+        return attacks
+
+    def attackable_squares(self):
+        '''
+        Returns a 2D boolean array (indexed [y, x]) of the squares any of the characters can attack to.
+        '''
+        return self.layers.any(axis=-1)
+
+
+def dilate(mask):
+    '''
+    Returns a copy of the boolean 2D array 'mask' where also the squares next to (not diagonally) a True square are True.
+    Dilating n times gives the squares within Manhattan distance n.
+    '''
+    result = mask.copy()
+    result[1:, :]  |= mask[:-1, :]
+    result[:-1, :] |= mask[1:, :]
+    result[:, 1:]  |= mask[:, :-1]
+    result[:, :-1] |= mask[:, 1:]
+    return result
@@ -0,0 +1,55 @@
+'''
+Runs the AI's search outside the GUI thread, so that the window stays responsive while the AI thinks.
+'''
+import pickle
+import traceback
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from ai.search import SearchAborted, SearchControl
+
+
+class AIThread(QThread):
+    '''
+    Thread in which the AI of the current player chooses its move.
+    The AI searches on a copy of the game, so the game shown in the GUI does not change while the AI thinks.
+    When the search is finished, the move is sent with the signal 'move_found'; the GUI applies it to its game
+    with apply_to. If the search is cancelled or fails, 'move_found' is sent with None.
+    '''
+    move_found  = pyqtSignal(object)    # The chosen Move, or None if the search was cancelled
+    progress    = pyqtSignal(int, int)  # Number of evaluated candidate moves, number of all candidate moves
+
+    def __init__(self, game, parent=None) -> None:
+        super().__init__(parent)
+        self.game    = pickle.loads(pickle.dumps(game, pickle.HIGHEST_PROTOCOL))
+        self.control = SearchControl(on_progress=self.progress.emit)
+        self.move    = None
+
+    def run(self):
+        try:
+            self.move = self.game.ai_get_move(self.control)
+        except SearchAborted:
+            self.move = None
+        except Exception:
+            traceback.print_exc()
+            self.move = None
+        self.move_found.emit(self.move)
+
+    def cancel(self):
+        '''
+        Asks the search to stop. The AI functions which do not accept a SearchControl cannot be stopped,
+        but their move is discarded.
+        '''
+        self.control.cancel()
+
+    def is_cancelled(self):
+        return self.control.cancelled
+
+    def apply_to(self, game, verbose=True):
+        '''
+        Applies the chosen move to 'game', which must be the game the thread was created from. The random number
+        generator of 'game' is advanced as it would have been if the AI had searched on it, so that a seeded game
+        is played the same way as with Game.ai_make_turn.
+        '''
+        game.rng.setstate(self.game.rng.getstate())
+        game.apply_move(self.move, verbose=verbose)
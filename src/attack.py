@@ -1,4 +1,3 @@
-import random
 from game_enums import AttackType, Stats
 from skill import Skill
 
@@ -26,17 +25,20 @@ class Attack:
         self.action_type    = "a"           # 'a' for attack
         
 
-    def calculate_damage(self, target, verbose=True):
+    def calculate_damage(self, target, verbose=True, rng=None):
         '''
         Method calculates the damage character would deal to 'target' with this attack. No actual damage will be done.
         Method assumes that target is in range of attack (can be determined with method define_attack_targets)
         @param target: The character which is taking the attack
         @param attack: The attack with which damage is dealt
+        @param rng: random.Random used for the hit roll. Defaults to that of the user's game.
         @return: Damage that would be done in hp
         '''
+        if rng is None:
+            rng = self.user.game.rng
                 
         damage = self.calculate_max_damage(target)        
-        miss = random.randint(1,100)
+        miss = rng.randint(1,100)
         if miss > self.calculate_accuracy(target):
             damage = 0
             if verbose:
@@ -135,6 +137,67 @@ class Attack:
         return self.target_enemy
 
 
+def combat_key(char):
+    '''
+    Returns a key describing all of the character's state which affects the damage and accuracy of attacks
+    made by or against it: class, effective stats, skills and HP.
+    '''
+    return (char.type, tuple(char.get_stats().values()), tuple(char.get_skills()), char.hp, char.maxhp)
+
+
+class CombatTable:
+    '''
+    Cache of the maximum damage, accuracy and probable damage of attacks, keyed by the attack type, the attacker's
+    and the defender's combat_key and the terrain the defender stands on.
+    The AI uses one table per turn; new_turn empties it when the turn changes.
+    '''
+    def __init__(self, max_entries=100000) -> None:
+        self.max_entries = max_entries
+        self.entries     = {}
+        self.turn        = None
+
+    def new_turn(self, turn):
+        '''
+        Empties the table if 'turn' (any value identifying the turn) differs from the previous one.
+        '''
+        if turn != self.turn:
+            self.entries.clear()
+            self.turn = turn
+
+    def clear(self):
+        '''
+        Empties the table and forgets the turn.
+        '''
+        self.entries.clear()
+        self.turn = None
+
+    def get(self, attack, target):
+        '''
+        Returns a tuple (max damage, accuracy, probable damage) of 'attack' against 'target', calculated with
+        Attack.calculate_max_damage, calculate_accuracy and calculate_probable_damage.
+        '''
+        terrain = target.board.get_terrain(target.get_square()).get_terrain()
+        key = (attack.type, combat_key(attack.user), combat_key(target), terrain)
+        values = self.entries.get(key)
+        if values is None:
+            max_damage = attack.calculate_max_damage(target)
+            accuracy   = attack.calculate_accuracy(target)
+            values     = (max_damage, accuracy, max_damage * (accuracy / 100))
+            if len(self.entries) >= self.max_entries:
+                self.entries.clear()
+            self.entries[key] = values
+        return values
+
+    def max_damage(self, attack, target):
+        return self.get(attack, target)[0]
+
+    def accuracy(self, attack, target):
+        return self.get(attack, target)[1]
+
+    def probable_damage(self, attack, target):
+        return self.get(attack, target)[2]
+
+
 
 class Melee(Attack):
     '''
@@ -0,0 +1,86 @@
+'''
+Micro-benchmark comparing Board.legal_squares_from_tile to the original queue-based implementation.
+Run from the src directory, e.g. with
+    python -m benchmarks.reachability [save file ...]
+'''
+import queue
+import sys
+import time
+
+import configload
+import gameIO
+from game_enums import Stats
+from board import Board
+
+
+def legacy_legal_squares_from_tile(board, char, init_square):
+    '''
+    The original implementation of Board.legal_squares_from_tile, kept for comparison.
+    '''
+    def coord2str(coord):
+        return f"{coord[0]},{coord[1]}"
+
+    legal_squares   = []
+    init_range      = char.get_stats()[Stats.RANGE]
+
+    can_stay, _     = board.get_tile(init_square).pass_by(char,init_range)
+    if can_stay:
+        legal_squares.append(init_square)
+
+    shortest_paths = {coord2str(init_square): init_range}
+    q = queue.Queue()
+    q.put((init_range, init_square))
+
+    while not q.empty():
+        steps_left, curr_square = q.get()
+        for direction in Board.DIRECTIONS:
+            new_square = (curr_square[0]+direction[0], curr_square[1]+direction[1])
+            if not 0 <= new_square[0] < board.width or not 0 <= new_square[1] < board.height:
+                continue
+            can_stay, steps_after_moving =  board.get_tile(new_square).pass_by(char, steps_left)
+            if can_stay and new_square not in legal_squares:
+                legal_squares.append(new_square)
+            elif not can_stay and board.get_piece(new_square) == char and new_square not in legal_squares:
+                legal_squares.append(new_square)
+            if steps_after_moving > 0:
+                if coord2str(new_square) not in shortest_paths or shortest_paths[coord2str(new_square)] < steps_after_moving:
+                    q.put((steps_after_moving, new_square))
+                    shortest_paths[coord2str(new_square)] = steps_after_moving
+
+    return legal_squares
+
+
+def run(filename, repeats=3):
+    '''
+    Runs both implementations for every character from every square of the map in 'filename',
+    checks that they return the same squares, and prints the calls per second of each.
+    '''
+    game  = gameIO.load_game(filename)
+    board = game.get_board()
+    chars = game.get_blue_player().get_characters() + game.get_red_player().get_characters()
+    cases = [(char, (x,y)) for char in chars for y in range(board.height) for x in range(board.width)]
+
+    for char, square in cases:
+        if board.legal_squares_from_tile(char, square) != legacy_legal_squares_from_tile(board, char, square):
+            raise AssertionError(f"Results differ for {char.get_name()} from {square}")
+
+    results = {}
+    for name, func in (('legacy', lambda c, s: legacy_legal_squares_from_tile(board, c, s)), ('current', board.legal_squares_from_tile)):
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for char, square in cases:
+                func(char, square)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = len(cases) / best
+
+    print(f"{filename} ({board.width}x{board.height}, {len(chars)} characters, {len(cases)} calls)")
+    print(f"  legacy:  {results['legacy']:10.0f} calls/s")
+    print(f"  current: {results['current']:10.0f} calls/s  ({results['current']/results['legacy']:.1f}x)")
+
+
+if __name__ == '__main__':
+    filenames = sys.argv[1:] if len(sys.argv) > 1 else [configload.get_filepath('savedata', 'save_yaml.yaml')]
+    for filename in filenames:
+        run(filename)
@@ -0,0 +1,50 @@
+'''
+Benchmark comparing the search speed of the AI functions.
+Each AI plays the given number of moves for both players from the start of the map, and the nodes
+searched per second are printed. Run from the src directory, e.g. with
+    python -m benchmarks.search [number of moves] [save file]
+'''
+import sys
+
+import configload
+import gameIO
+from ai.search import SearchStats
+import ai.game_ai_4 as game_ai_4
+import ai.game_ai_5 as game_ai_5
+
+
+AI_FUNCTIONS = {
+    'game_ai_4' : game_ai_4.get_move,
+    'game_ai_5' : game_ai_5.get_move,
+}
+
+
+def run(filename, name, ai_func, moves):
+    '''
+    Lets 'ai_func' play 'moves' moves on the map in 'filename' and returns its SearchStats.
+    '''
+    game = gameIO.load_game(filename)
+    game.set_seed(0)
+    game_ai_4.reset_caches()
+    stats = SearchStats()
+    for player in game.players.values():
+        player.ai = True
+        player.ai_func = lambda game, color: ai_func(game, color, stats=stats)
+
+    for _ in range(moves):
+        if game.is_game_over():
+            break
+        if game.is_player_ready():
+            game.change_turn(verbose=False)
+        game.ai_make_turn(verbose=False)
+
+    print(f"  {name}: {stats}")
+    return stats
+
+
+if __name__ == '__main__':
+    moves    = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    filename = sys.argv[2] if len(sys.argv) > 2 else configload.get_filepath('savedata', 'save_yaml.yaml')
+    print(f"{filename}, {moves} moves")
+    for name, ai_func in AI_FUNCTIONS.items():
+        run(filename, name, ai_func, moves)
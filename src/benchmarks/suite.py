@@ -0,0 +1,263 @@
+'''
+Benchmark suite measuring the speed of the engine and the AI on the canonical maps in benchmarks/maps.
+The results are written as JSON, and compared against a stored baseline: a metric which is worse than in the
+baseline by more than the threshold is reported as a regression, and the exit status is 1.
+Run from the src directory, e.g. with
+    python -m benchmarks.suite [--maps small medium large] [--output results.json] [--threshold 0.2] [--tolerance 0.005]
+    python -m benchmarks.suite --update-baseline
+Larger maps can be made with mapgen and given to --maps as files.
+'''
+import argparse
+import datetime
+import json
+import os
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+
+import gameIO
+from ai.distance import DistanceMap
+import ai.game_ai_4 as game_ai_4
+
+
+MAPS_DIR        = pathlib.Path(__file__).parent / 'maps'
+BASELINE_FILE   = pathlib.Path(__file__).parent / 'baseline.json'
+MAPS            = ['small', 'medium', 'large']
+
+# Metric -> True if a higher value is better, False if a lower one is
+METRICS = {
+    'distance_map_build_s'  : False,
+    'legal_squares_per_s'   : True,
+    'threat_board_s'        : False,
+    'heuristic_evals_per_s' : True,
+    'ai_make_turn_s'        : False,
+    'save_s'                : False,
+    'load_s'                : False,
+}
+
+# Slowdown in seconds which the times are allowed in any case, as the relative threshold alone would
+# report the noise of millisecond-scale measurements as regressions
+DEFAULT_TOLERANCE = 0.005
+
+# Measurements shorter than this are repeated until their total time reaches it, so that the best time of
+# millisecond-scale measurements is not decided by a few noisy samples
+MIN_MEASURE_TIME = 0.2
+
+
+def best_time(func, repeats, setup=None):
+    '''
+    Calls 'func' at least 'repeats' times, and more often until the calls have taken MIN_MEASURE_TIME seconds,
+    and returns the shortest time one call took, in seconds.
+    @param setup: Function called before each call, outside the measured time (optional)
+    '''
+    best, total, calls = None, 0.0, 0
+    while calls < repeats or total < MIN_MEASURE_TIME:
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        calls += 1
+    return best
+
+
+def get_characters(game):
+    return game.get_blue_player().get_characters() + game.get_red_player().get_characters()
+
+
+def clear_caches(game):
+    '''
+    Empties the legal squares cached by the board and game_ai_4's combat table, so that every repeat of
+    a measurement starts from the same state as the first one.
+    '''
+    game.get_board().reachability_cache.clear()
+    game_ai_4.combat_table.clear()
+
+
+def bench_distance_map(game, repeats):
+    '''
+    Time to build the full distance map of the board, without the lazy mode or the disk cache.
+    '''
+    board = game.get_board()
+    return best_time(lambda: DistanceMap(board, lazy=False, disk_cache=False), repeats)
+
+
+def bench_legal_squares(game, repeats):
+    '''
+    Calls of Board.legal_squares_from_tile per second, for every character from every square.
+    '''
+    board = game.get_board()
+    cases = [(char, (x,y)) for char in get_characters(game) for y in range(board.height) for x in range(board.width)]
+    def run():
+        for char, square in cases:
+            board.legal_squares_from_tile(char, square)
+    return len(cases) / best_time(run, repeats)
+
+
+def bench_threat_board(game, repeats):
+    '''
+    Time to construct the threat boards of both players, with empty caches.
+    '''
+    def run():
+        for player in game.players.values():
+            game_ai_4.construct_player_threat_board(game, player)
+    return best_time(run, repeats, lambda: clear_caches(game))
+
+
+def bench_heuristic(game, repeats):
+    '''
+    Evaluations of game_ai_4.get_heuristic_board_value per second, for every character of the player in turn.
+    The transposition table is not used and the combat table is emptied before each repeat, so that every
+    evaluation is calculated in full.
+    '''
+    player = game.get_current_player()
+    enemy  = [p for p in game.players.values() if p is not player][0]
+    player_threat_board = game_ai_4.construct_player_threat_board(game, player)
+    enemy_threat_board  = game_ai_4.construct_player_threat_board(game, enemy)
+    chars = player.get_characters()
+    def run():
+        for char in chars:
+            game_ai_4.get_heuristic_board_value(game, char, player.color, player_threat_board, enemy_threat_board)
+    return len(chars) / best_time(run, repeats, game_ai_4.combat_table.clear)
+
+
+def bench_ai_make_turn(filename, moves):
+    '''
+    Mean time of Game.ai_make_turn with game_ai_4 over the first 'moves' moves of the game, on a fresh copy of the map.
+    '''
+    game_ai_4.reset_caches()
+    game = gameIO.load_game(filename)
+    for player in game.players.values():
+        player.ai = True
+        player.ai_func = game_ai_4.get_move
+    total, played = 0.0, 0
+    while played < moves and not game.is_game_over():
+        if game.is_player_ready():
+            game.change_turn(verbose=False)
+            continue
+        start = time.perf_counter()
+        game.ai_make_turn(verbose=False)
+        total  += time.perf_counter() - start
+        played += 1
+    return total / max(1, played)
+
+
+def bench_save_load(game, repeats):
+    '''
+    Times to save the game to a file and to load it from the file.
+    '''
+    handle, path = tempfile.mkstemp(suffix='.yaml')
+    os.close(handle)
+    try:
+        save_time = best_time(lambda: gameIO.save_game(game, path), repeats)
+        load_time = best_time(lambda: gameIO.load_game(path), repeats)
+    finally:
+        os.remove(path)
+    return save_time, load_time
+
+
+def run_map(name, repeats=3, moves=4):
+    '''
+    Runs all benchmarks on the canonical map 'name', or on the save file 'name' (e.g. one made with mapgen),
+    and returns a dictionary from metric to value.
+    '''
+    filename = name if name not in MAPS else str(MAPS_DIR / f'{name}.yaml')
+    game = gameIO.load_game(filename)
+    results = {}
+    results['distance_map_build_s']  = bench_distance_map(game, repeats)
+    results['legal_squares_per_s']   = bench_legal_squares(game, repeats)
+    results['threat_board_s']        = bench_threat_board(game, repeats)
+    results['heuristic_evals_per_s'] = bench_heuristic(game, repeats)
+    results['ai_make_turn_s']        = bench_ai_make_turn(filename, moves)
+    results['save_s'], results['load_s'] = bench_save_load(game, repeats)
+    return results
+
+
+def run(maps=MAPS, repeats=3, moves=4, verbose=True):
+    '''
+    Runs the benchmarks on the given maps and returns the results in the format written to the JSON file.
+    '''
+    results = {}
+    for name in maps:
+        results[name] = run_map(name, repeats, moves)
+        if verbose:
+            print(name)
+            for metric, value in results[name].items():
+                print(f"  {metric:<24} {value:14.6g}")
+    return {
+        'created'   : datetime.datetime.now().isoformat(timespec='seconds'),
+        'python'    : platform.python_version(),
+        'platform'  : platform.platform(),
+        'repeats'   : repeats,
+        'moves'     : moves,
+        'results'   : results,
+    }
+
+
+def compare(current, baseline, threshold, tolerance=DEFAULT_TOLERANCE):
+    '''
+    Compares the results to the baseline and returns a list of descriptions of the regressions: metrics which are
+    worse than in the baseline by more than 'threshold' (a fraction, e.g. 0.2 for 20 %). A time is a regression
+    only if it is also more than 'tolerance' seconds longer than in the baseline.
+    Metrics or maps missing from either are skipped.
+    '''
+    regressions = []
+    for name, metrics in current['results'].items():
+        for metric, value in metrics.items():
+            base = baseline['results'].get(name, {}).get(metric)
+            if base is None or base <= 0 or metric not in METRICS:
+                continue
+            # Relative change, positive if the metric got worse
+            if METRICS[metric]:
+                worse = (base - value) / base
+            else:
+                worse = (value - base) / base
+                if value - base <= tolerance:
+                    continue
+            if worse > threshold:
+                regressions.append(f"{name} {metric}: {value:.6g} (baseline {base:.6g}, {100*worse:.0f} % worse)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the benchmark suite and compares the results to a baseline.')
+    parser.add_argument('--maps', nargs='+', default=MAPS, help=f'canonical maps ({", ".join(MAPS)}) or save files to run the benchmarks on')
+    parser.add_argument('--repeats', type=int, default=3, help='repeats of each measurement; the best is used (default 3)')
+    parser.add_argument('--moves', type=int, default=4, help='AI moves to time on each map (default 4)')
+    parser.add_argument('--output', default=None, help='JSON file to write the results to')
+    parser.add_argument('--baseline', default=str(BASELINE_FILE), help='JSON file of the baseline results')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown compared to the baseline, as a fraction (default 0.2)')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help=f'slowdown in seconds allowed for the times in any case (default {DEFAULT_TOLERANCE})')
+    parser.add_argument('--update-baseline', action='store_true', help='write the results as the new baseline instead of comparing')
+    args = parser.parse_args()
+
+    results = run(args.maps, args.repeats, args.moves)
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"No baseline found at {args.baseline}")
+        return
+    with open(args.baseline, 'r') as file:
+        baseline = json.load(file)
+    regressions = compare(results, baseline, args.threshold, args.tolerance)
+    if len(regressions) > 0:
+        print(f"{len(regressions)} regressions (threshold {100*args.threshold:.0f} %):")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"No regressions (threshold {100*args.threshold:.0f} %)")
+
+
+if __name__ == '__main__':
+    main()
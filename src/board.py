@@ -1,19 +1,51 @@
 from game_errors import IllegalMoveException
-import threading
-import queue
+from array import array
+from collections import deque
 import ai.distance
+import zobrist
 from game_enums import Stats
+from tile import TERRAIN_TILES, TileView, terrain_id
 
 class Board:
     
     DIRECTIONS = [[-1,0],[0,1],[1,0],[0,-1]]
+
+    # If True, every get_square call checks that the position index matches the board (slow; used in tests)
+    CHECK_POSITIONS = False
     
     def set_board(self,board):
-        self.board = board
-        self.height = len(self.board)
-        self.width  = len(self.board[0])
+        '''
+        Sets the terrain of the board. The board starts empty.
+        @param board: List of rows of tiles (e.g. tile.terrain_tile(Terrain.PLAIN)); only their terrain is stored
+        '''
+        self.height = len(board)
+        self.width  = len(board[0])
+        self.terrain_grid = bytearray([ terrain_id(tile.terrain) for row in board for tile in row ])  # Square id -> terrain id
+        self.occupants    = [None] * (self.width * self.height)     # Square id -> object on the square, or None
+        self.positions = {}     # Object -> coordinates (x,y) of the square it is in
+        self.version = 0        # Occupancy version; increased every time an object is placed or removed
+        self.reachability_cache = {}    # (char, init_square, range, skills) -> legal squares, valid for reachability_version
+        self.reachability_version = 0
+        self.zobrist_hash = 0   # Zobrist hash of the objects on the board
+        self.hash_parts = {}    # Object -> its part of the hash
+        self.terrain_hash = zobrist.terrain_hash(self.width, self.height, self.terrain_grid)
+        self.dirty = set()      # Squares (x,y) whose contents have changed since the GUI last drew them
+        self.init_search_tables()
         self.distmap = ai.distance.DistanceMap(self)
     
+    def init_search_tables(self):
+        '''
+        Initializes the tables used by legal_squares_from_tile. Squares are handled there as integer ids:
+        square (x,y) has the id y*width+x.
+        '''
+        n = self.width * self.height
+        self.square_coords  = [(x,y) for y in range(self.height) for x in range(self.width)]
+        self.neighbours     = []    # Square id -> ids of neighbouring squares, in the order of Board.DIRECTIONS
+        for x, y in self.square_coords:
+            self.neighbours.append(tuple([ (y+dy)*self.width + x+dx for dx, dy in Board.DIRECTIONS if 0 <= x+dx < self.width and 0 <= y+dy < self.height ]))
+        self.best_steps     = array('d', [0.0]) * n   # Most steps left when a square has been reached; reset after each search
+        self.in_result      = bytearray(n)           # 1 if the square is already in the result; reset after each search
+    
     def get_height(self):
         return self.height
     
@@ -28,22 +60,32 @@ class Board:
         @param coordinates: Coordinates in format (x,y)
         @return: Object in tile in chosen square
         ''' 
-        return self.board[coordinates[1]][coordinates[0]].get_object()
+        return self.occupants[coordinates[1]*self.width + coordinates[0]]
     
     def set_tile(self,tile,coordinates):
         '''
-        Sets the given tile to given coordinates.
+        Sets the terrain of the given tile to given coordinates.
         @param tile: A tile-type object
         '''
-        self.board[coordinates[1]][coordinates[0]] = tile
+        self.terrain_grid[coordinates[1]*self.width + coordinates[0]] = terrain_id(tile.terrain)
+        self.terrain_hash = zobrist.terrain_hash(self.width, self.height, self.terrain_grid)
+        self.dirty.add((coordinates[0], coordinates[1]))
+        self.version += 1
     
     def get_tile(self,coordinates):
         '''
         Returns the tile in chosen square (for example the plain object, not character object)
         @param coordinates: Coordinates in format (x,y)
-        @return: Tile in chosen square
+        @return: TileView of the chosen square
         '''
-        return self.board[coordinates[1]][coordinates[0]]
+        return TileView(self, coordinates[1]*self.width + coordinates[0])
+    
+    def get_terrain(self,coordinates):
+        '''
+        Returns the shared tile of the terrain in chosen square, without the object on it.
+        @param coordinates: Coordinates in format (x,y)
+        '''
+        return TERRAIN_TILES[self.terrain_grid[coordinates[1]*self.width + coordinates[0]]]
     
     
     def set_object(self,coordinates,object):
@@ -52,8 +94,15 @@ class Board:
         @param coordinates: Coordinates in format (x,y)
         @param object: Object we wish to place
         '''
-        if self.get_tile(coordinates).get_object() == None:
-            self.board[coordinates[1]][coordinates[0]].set_object(object)
+        if self.get_piece(coordinates) == None:
+            self.occupants[coordinates[1]*self.width + coordinates[0]] = object
+            self.positions[object] = (coordinates[0], coordinates[1])
+            self.hash_parts[object] = zobrist.object_hash(object, self.positions[object])
+            self.zobrist_hash ^= self.hash_parts[object]
+            if hasattr(object, 'invalidate_stats'):
+                object.invalidate_stats()   # The terrain bonuses of the new square apply
+            self.dirty.add(self.positions[object])
+            self.version += 1
             return
         else:
             raise KeyError("Square is already occupied!")
@@ -63,11 +112,15 @@ class Board:
         Removes character from tile in the chosen coordinates.
         @param coordinates: Coordinates in format (x,y)
         '''
-        tile = self.get_tile(coordinates)
-        #gui_tile = tile.get_gui_tile()
-        tile.remove_object()
-        #if gui_tile != None: # If playing without gui, or testing
-        #    gui_tile.set_image(None,True)
+        object = self.get_piece(coordinates)
+        if object is not None and self.positions.get(object) == (coordinates[0], coordinates[1]):
+            del self.positions[object]
+            self.zobrist_hash ^= self.hash_parts.pop(object)
+            if hasattr(object, 'invalidate_stats'):
+                object.invalidate_stats()
+        self.occupants[coordinates[1]*self.width + coordinates[0]] = None
+        self.dirty.add((coordinates[0], coordinates[1]))
+        self.version += 1
     
     
     def get_square(self, object):
@@ -77,12 +130,71 @@ class Board:
         @param object: The object we are looking for.
         @return: Coordinates for the squre where the object is found (or none).
         '''
+        if Board.CHECK_POSITIONS:
+            self.check_positions()
+        return self.positions.get(object)
+    
+    def update_hash(self, object):
+        '''
+        Updates the object's part of the Zobrist hash. Must be called whenever the hashed state of an object
+        on the board (e.g. a character's HP) changes.
+        @param object: The object whose state has changed
+        '''
+        old = self.hash_parts.get(object)
+        if old is not None:
+            new = zobrist.object_hash(object, self.positions[object])
+            self.zobrist_hash ^= old ^ new
+            self.hash_parts[object] = new
+            self.dirty.add(self.positions[object])
+
+    def refresh_hash(self):
+        '''
+        Calculates the Zobrist hash again for every object on the board, e.g. after their state has been
+        changed directly.
+        '''
+        old = self.hash_parts
+        self.hash_parts = { object: zobrist.object_hash(object, square) for object, square in self.positions.items() }
+        for object, square in self.positions.items():
+            if old.get(object) != self.hash_parts[object]:
+                self.dirty.add(square)
+        self.zobrist_hash = 0
+        for part in self.hash_parts.values():
+            self.zobrist_hash ^= part
+
+    def mark_dirty(self, coordinates):
+        '''
+        Marks the square to be drawn again, for changes the board does not notice itself.
+        @param coordinates: Coordinates in format (x,y)
+        '''
+        self.dirty.add((coordinates[0], coordinates[1]))
+
+    def take_dirty(self):
+        '''
+        Returns the squares which have changed since the last call, and starts tracking the changes anew.
+        @return: Set of coordinates in format (x,y)
+        '''
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    def get_hash(self):
+        '''
+        Returns the Zobrist hash of the objects on the board and their state.
+        '''
+        return self.zobrist_hash
+
+    def check_positions(self):
+        '''
+        Checks that the position index used by get_square matches the objects on the board.
+        Raises AssertionError if they differ.
+        '''
+        on_board = {}
         for y in range(self.height):
             for x in range(self.width):
-                if self.board[y][x].get_object() == object:
-                    return (x,y)
-                
-        return None
+                object = self.occupants[y*self.width + x]
+                if object is not None:
+                    on_board[object] = (x,y)
+        if on_board != self.positions:
+            raise AssertionError(f"Position index does not match the board!\nBoard: {on_board}\nIndex: {self.positions}")
     
     
     def move_char(self,src,dst, verbose=True):
@@ -90,7 +202,8 @@ class Board:
         Moves the piece from square src OR char src to square dst if able.
         Src can be either the actual object or coordinates it is in.
         Method doesn't check if character should be able to move to chosen tile; it
-        should be checked by other methods.
+        should be checked by other methods. Staying in the current square is always allowed, even if the
+        character could not otherwise end its movement there.
         @param src: Original square in format (x,y) OR char we want to move
         @param dst: Destination square in format (x,y)
         '''
@@ -108,7 +221,7 @@ class Board:
         coordinates = self.get_square(char)
         legal_squares = char.get_legal_squares()
     
-        if dst not in legal_squares:
+        if dst not in legal_squares and (dst[0], dst[1]) != coordinates:
             raise IllegalMoveException("Cannot move to chosen tile!")
         
         
@@ -131,61 +244,99 @@ class Board:
         return self.legal_squares_from_tile(char, char.get_square())
     
 
+    def cached_legal_squares_from_tile(self, char, init_square):
+        '''
+        Same as legal_squares_from_tile, but the result is cached until the next time an object is placed on
+        or removed from the board. The cache is keyed by the character, starting square, range and skills.
+        @param char: Character whose legit squares we are intrested in
+        @param init_square: Coordinates of starting tile in format (x,y)
+        @return: List of legit squares in format (x,y)
+        '''
+        if self.reachability_version != self.version:
+            self.reachability_cache = {}
+            self.reachability_version = self.version
+        key = (char, (init_square[0], init_square[1]), char.get_stats()[Stats.RANGE], tuple(char.get_skills()))
+        legal_squares = self.reachability_cache.get(key)
+        if legal_squares is None:
+            legal_squares = self.legal_squares_from_tile(char, init_square)
+            self.reachability_cache[key] = legal_squares
+        return list(legal_squares)
+    
+
     def legal_squares_from_tile(self,char,init_square):
         '''
         Method defines all squares object can move to from a chosen square.
         Note that character doesn't have to be currently on said tile.
+        The search runs over integer square ids and uses the tables set up in init_search_tables.
         @param char: Character whose legit squares we are intrested in
         @param square: Coordinates of starting tile in format (x,y)
-        @return: List of legit squares in format (x,y)
+        @return: List of legit squares in format (x,y), in the order they were found
         '''
-        # Helper function to turn cordinates into strings
-        def coord2str(coord):
-            return f"{coord[0]},{coord[1]}"
-        
         legal_squares   = []
         init_range      = char.get_stats()[Stats.RANGE]
-        
-        # Check if the character can stay on the very first square
-        can_stay, _     = self.get_tile(init_square).pass_by(char,init_range)
-        if can_stay:
-            legal_squares.append(init_square)
+        skills          = char.get_skills()
+        tiles           = TERRAIN_TILES
+        terrain_grid    = self.terrain_grid
+        occupants       = self.occupants
+        neighbours      = self.neighbours
+        square_coords   = self.square_coords
+        best_steps      = self.best_steps
+        in_result       = self.in_result
+        rules           = {}    # Terrain id -> the character's movement rule on that terrain
+        reached         = []    # Square ids whose best_steps has been set, to reset them afterwards
+        init_id         = init_square[1]*self.width + init_square[0]
 
-        # Dictionary keeping track which squares has already been traversed, and which is the current maximum steps left it has been reached
-        shortest_paths = {coord2str(init_square): init_range} 
-        
-        # Queue for the BFS
-        q = queue.Queue()
-        q.put((init_range, init_square))
+        try:
+            # Check if the character can stay on the very first square
+            can_stay, _     = tiles[terrain_grid[init_id]].pass_by(char,init_range,object=occupants[init_id])
+            if can_stay:
+                legal_squares.append(init_square)
+                in_result[init_id] = 1
 
-        # Conduct the breadth-first search
-        while not q.empty():
+            # Keep track of the maximum steps left with which each square has been reached
+            best_steps[init_id] = init_range
+            reached.append(init_id)
 
-            # How many steps the character can still take, what is the current square in the search
-            steps_left, curr_square = q.get()
+            # Queue for the BFS
+            q = deque()
+            q.append((init_range, init_id))
 
-            # Loop through all four neighbouring squares
-            for direction in Board.DIRECTIONS:
-                new_square = (curr_square[0]+direction[0], curr_square[1]+direction[1])
+            # Conduct the breadth-first search
+            while q:
 
-                # Skip if out of bounds
-                if not 0 <= new_square[0] < self.width or not 0 <= new_square[1] < self.height:
-                    continue
-                can_stay, steps_after_moving =  self.get_tile(new_square).pass_by(char, steps_left)
-                
-                # Add to list if the character can stay in this square
-                if can_stay and new_square not in legal_squares:
-                    legal_squares.append(new_square)
-
-                # Add to list if tile.pass_by_square did not tell that the character can stand on this tile due to it already being there
-                elif not can_stay and self.get_piece(new_square) == char and new_square not in legal_squares:
-                    legal_squares.append(new_square)
-
-                # If there are steps left and this is the currently best path to the square, add to queue
-                if steps_after_moving > 0:
-                    if coord2str(new_square) not in shortest_paths or shortest_paths[coord2str(new_square)] < steps_after_moving:
-                        q.put((steps_after_moving, new_square))
-                        shortest_paths[coord2str(new_square)] = steps_after_moving
+                # How many steps the character can still take, what is the current square in the search
+                steps_left, curr_id = q.popleft()
+
+                # Loop through all (at most four) neighbouring squares
+                for new_id in neighbours[curr_id]:
+                    terrain = terrain_grid[new_id]
+                    tile = tiles[terrain]
+                    rule = rules.get(terrain)
+                    if rule is None:
+                        rule = tile.get_movement_rule(char)
+                        rules[terrain] = rule
+                    object = occupants[new_id]
+                    can_stay, steps_after_moving = tile.pass_by(char, steps_left, rule, skills, object)
+
+                    # Add to list if the character can stay in this square, or if tile.pass_by did not tell that
+                    # the character can stand on this tile due to it already being there
+                    if not in_result[new_id] and (can_stay or object is char):
+                        legal_squares.append(square_coords[new_id])
+                        in_result[new_id] = 1
+
+                    # If there are steps left and this is the currently best path to the square, add to queue
+                    if steps_after_moving > 0 and best_steps[new_id] < steps_after_moving:
+                        if best_steps[new_id] == 0:
+                            reached.append(new_id)
+                        q.append((steps_after_moving, new_id))
+                        best_steps[new_id] = steps_after_moving
+
+        finally:
+            # Reset the shared tables for the next search
+            for square_id in reached:
+                best_steps[square_id] = 0.0
+            for square in legal_squares:
+                in_result[square[1]*self.width + square[0]] = 0
         
         return legal_squares
     
@@ -2,10 +2,10 @@
 Instance of this class is an independent character
 '''
 from enum import Enum
+from types import MappingProxyType
 import configload
 from game_enums import Stats
 from game_errors import IllegalMoveException
-from confirmwindow import ConfirmAttack
 import random
 import skill
 import attack
@@ -32,6 +32,7 @@ class Character:
         self.stats = {Stats.ATTACK: 0, Stats.DEFENSE: 0, Stats.MAGIC: 0,\
                        Stats.RESISTANCE: 0, Stats.SPEED: 0, Stats.EVASION: 0, Stats.RANGE: 0}
         self.init_stats = dict(self.stats)
+        self.effective_stats = None # Cached result of get_stats, or None if it has to be calculated again
         self.attacks = []
         self.skills = []
         self.legal_squares = None
@@ -49,13 +50,19 @@ class Character:
         self.stats = dict(self.init_stats)
         #self.stats[Stats.RANGE] = self.init_range
         #self.range = self.init_range
+        self.invalidate_stats()
+        self.update_hash()
     
     def get_stats(self):
         '''
         Calculates the terrain's effect in the stats.
+        The result is cached until the character moves or its stats or skills change (see invalidate_stats),
+        and is returned as a read-only mapping.
         '''
+        if self.effective_stats is not None:
+            return self.effective_stats
         stats = dict(self.stats)
-        stat_enhanc = self.board.get_tile(self.get_square()).get_combat_bonuses()
+        stat_enhanc = self.board.get_terrain(self.get_square()).get_combat_bonuses()
         stats[Stats.ATTACK]     += stat_enhanc[Stats.ATTACK]
         stats[Stats.DEFENSE]    += stat_enhanc[Stats.DEFENSE]
         stats[Stats.MAGIC]      += stat_enhanc[Stats.MAGIC]
@@ -64,7 +71,15 @@ class Character:
         stats[Stats.EVASION]    += stat_enhanc[Stats.EVASION]
         for skill in self.get_full_skills():
             skill.get_stats(stats)
-        return stats
+        self.effective_stats = MappingProxyType(stats)
+        return self.effective_stats
+
+    def invalidate_stats(self):
+        '''
+        Drops the cached result of get_stats. Must be called whenever the character's square,
+        base stats or skills change.
+        '''
+        self.effective_stats = None
     
     def modify_stats(self,stat_enhanc,range_enhac):
         '''
@@ -78,6 +93,22 @@ class Character:
         self.stats[Stats.EVASION] += stat_enhanc[Stats.EVASION]
         self.stats[Stats.RANGE] += range_enhac
         #self.range += range_enhac
+        self.invalidate_stats()
+        self.update_hash()
+          
+    def update_hash(self):
+        '''
+        Updates the character's part of the board's Zobrist hash after its state has changed.
+        '''
+        self.board.update_hash(self)
+
+    def __getstate__(self):
+        '''
+        The cached stats are not pickled, as the read-only mapping cannot be; they are calculated again when needed.
+        '''
+        state = dict(self.__dict__)
+        state['effective_stats'] = None
+        return state
           
     def get_range(self):
         return self.stats[Stats.RANGE]
@@ -91,9 +122,13 @@ class Character:
                 return 
             self.delete_skill(new_skill.type)
         self.skills.append(new_skill)
+        self.invalidate_stats()
+        self.update_hash()
 
     def delete_skill(self, skill_type):
         self.skills = [sk for sk in self.skills if sk.type != skill_type]
+        self.invalidate_stats()
+        self.update_hash()
         
     def has_skill(self, skill_type):
         return len([sk for sk in self.skills if sk.type == skill_type]) > 0
@@ -102,12 +137,11 @@ class Character:
         '''
         Returns list of squares character can move to this turn.
         Initilized to None at the beginning of each turn.
+        The squares are cached by the board until its occupancy changes.
         '''
         if self.init_square == None:
-            self.legal_squares = self.board.legal_squares(self)
             self.init_square = self.get_square()
-        else:
-            self.legal_squares = self.board.legal_squares_from_tile(self,self.init_square)
+        self.legal_squares = self.board.cached_legal_squares_from_tile(self,self.init_square)
         return self.legal_squares
     
     def get_type(self):
@@ -161,6 +195,7 @@ class Character:
         amount = max(amount, 0)
         amount = min(amount, self.maxhp-self.hp)
         self.hp += amount
+        self.update_hash()
         if verbose:
             print("{} paransi {} hp vahinkoa.".format(self.get_name(),amount))
         if self.hp > self.maxhp:
@@ -170,6 +205,7 @@ class Character:
         amount = max(amount, 0)
         amount = min(amount, self.maxhp)
         self.hp -= amount
+        self.update_hash()
         if verbose:
             print("{} otti {} hp vahinkoa.".format(self.get_name(),amount))
         if self.hp <= 0:
@@ -179,6 +215,7 @@ class Character:
         self.hp = hp
         if self.hp > self.maxhp:
             self.hp = self.maxhp
+        self.update_hash()
         if self.hp <= 0:
             self.die(verbose=verbose)
             
@@ -193,10 +230,12 @@ class Character:
     
     def set_ready(self):
         self.ready = True
+        self.update_hash()
         
     def set_not_ready(self):
         self.init_square = None
         self.ready = False
+        self.update_hash()
         
     def get_game(self):
         return self.game
@@ -207,6 +246,8 @@ class Character:
     def set_carrying(self,char):
         self.carrying = char
         char.set_carried()
+        if self.get_square() != None:
+            self.board.mark_dirty(self.get_square())   # The carried character is drawn on this square
         
     def remove_carrying(self,square):
         if square:
@@ -214,6 +255,8 @@ class Character:
             self.carrying.get_owner().add_character(self.carrying)
         self.carrying.set_not_carried()
         self.carrying = None
+        if self.get_square() != None:
+            self.board.mark_dirty(self.get_square())
         
     def get_carrying(self):
         return self.carrying
@@ -239,6 +282,8 @@ class Character:
             self.skills.append(skill.Capture(self))
             if self.get_owner() == self.game.get_ai():
                 self.skills.append(skill.Execute(self))
+        self.invalidate_stats()
+        self.update_hash()
         
     def set_transfer(self):
         '''
@@ -254,6 +299,8 @@ class Character:
             self.skills.remove(transfer)
         else:
             self.skills.append(skill.Transfer(self))
+        self.invalidate_stats()
+        self.update_hash()
         
         
     def get_path(self):
@@ -327,10 +374,8 @@ class Character:
         
         #print(self.game.get_board().get_tile(self.game.get_board().get_square(self)))
         #print(self.tile.get_gui_tile())
-        if not self.get_owner().is_ai() and self.game.get_board().get_tile(self.game.get_board().get_square(self)) != None: # If player controls char and gui is active
-            wnd = ConfirmAttack(self,attack,target)     
-            if not wnd.exec_():
-                return
+        if not self.game.confirm(self, attack, target):
+            return
         
         if verbose:
             print("{} hyokkasi hahmoon {} hyokkayksella {}!".format(self.get_name(),target.get_name(),attack.get_name()))
@@ -402,16 +447,17 @@ class Character:
         
         
             
-    def new_turn(self):
+    def new_turn(self, verbose=True):
         '''
         Resets character's stats every turn (self.ready, etc)
+        @param verbose: If False, the skills do not print what they do
         '''
         self.ready = False
         self.init_square = None
         self.reset_stats()
 
         for sk in self.get_full_skills():
-            sk.new_turn()
+            sk.new_turn(verbose=verbose)
 
     def __str__(self):
         '''
@@ -678,5 +724,7 @@ def from_dict(data, game):
             raise ValueError(key)
         char.key = value
         setattr(char, key, value)
+    char.invalidate_stats()
+    char.update_hash()
         
     return char
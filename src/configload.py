@@ -19,14 +19,86 @@ def load_config():
         config = yaml.safe_load(file)
     return config
 
+
+class Config:
+    '''
+    Parsed contents of the config file, with the directory paths and the paths of the images resolved in advance,
+    so that looking them up needs no file access.
+    '''
+    def __init__(self) -> None:
+        self.path = CONFIGDIR / CONFIGFILE
+        self.load()
+
+    def load(self):
+        '''
+        Reads the config file again.
+        '''
+        self.mtime  = self.get_mtime()
+        self.data   = load_config()
+        self.dirs   = { name: str(ROOTPATH.joinpath(path)) for name, path in self.data['directories'].items() }
+        self.images = {}    # Filename -> full path of the files in the images directory
+        images = pathlib.Path(self.dirs['images']) if 'images' in self.dirs else None
+        if images is not None and images.is_dir():
+            self.images = { file.name: str(file) for file in images.iterdir() }
+
+    def get_mtime(self):
+        try:
+            return self.path.stat().st_mtime
+        except OSError:
+            return None
+
+    def is_modified(self):
+        '''
+        Returns True if the config file has been modified since it was read.
+        '''
+        return self.get_mtime() != self.mtime
+
+
+config = None   # The cached Config, loaded on first use
+
+
+def get_config():
+    '''
+    Returns the cached Config, reading the config file if it has not been read yet.
+    '''
+    global config
+    if config is None:
+        config = Config()
+    return config
+
+def reload():
+    '''
+    Reads the config file again, e.g. after it has been edited.
+    '''
+    global config
+    config = Config()
+    return config
+
+def reload_if_modified():
+    '''
+    Reads the config file again if it has been modified since it was read.
+    @return: True if the config was reloaded
+    '''
+    if config is not None and not config.is_modified():
+        return False
+    reload()
+    return True
+
 def getdir(dirname: str):
     '''
     Returns full path to the directory specified in dirname as a string.
     @param dirname: Name of the directory. Must be exactly as it is in configfile and under section 'directories'.
     '''
-    config = load_config()
-    path = config['directories'][dirname]
-    return str(ROOTPATH.joinpath(path))
+    return get_config().dirs[dirname]
+
+def get_setting(section: str, name: str, default=None):
+    '''
+    Returns the value of setting 'name' under section 'section' in the config file, or 'default' if it is not set.
+    '''
+    config = get_config().data
+    if section not in config or config[section] is None or name not in config[section]:
+        return default
+    return config[section][name]
 
 def get_filepath(dirname: str, filename: str):
     '''
@@ -39,4 +111,7 @@ def get_image(filename):
     '''
     Convenience function to simplify image path acquisition. Equivalent to get_filepath('images', filename).
     '''
-    return get_filepath('images', filename)
+    path = get_config().images.get(filename)
+    if path is None:
+        return get_filepath('images', filename)
+    return path
@@ -3,6 +3,8 @@ File includes classes needed for attack/skill confirmations.
 '''
 
 
+import pathlib
+
 from PyQt5.QtWidgets import QGridLayout, QPushButton, QLabel, QDialog, QWidget
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QIcon
@@ -76,4 +78,34 @@ class ConfirmSkill(QDialog):
         yesbutton.clicked.connect(self.reject)
         self.grid.addWidget(yesbutton,1,2)
         
-        self.show()
\ No newline at end of file
+        self.show()
+
+
+def confirm_attack(user, attack, target):
+    '''
+    Asks the player to confirm the attack with a ConfirmAttack window. Given to Game.set_confirmation by the GUI.
+    @return: True if the player confirmed the attack
+    '''
+    return bool(ConfirmAttack(user, attack, target).exec_())
+
+
+def confirm_skill(user, skill, info):
+    '''
+    Asks the player to confirm the skill with a ConfirmSkill window. Given to Game.set_confirmation by the GUI.
+    @return: True if the player confirmed the skill
+    '''
+    return bool(ConfirmSkill(user, skill, info).exec_())
+
+
+class ErrorWindow(QDialog):
+    
+    def __init__(self,text):
+        super().__init__()
+        self.setWindowTitle('Virhe!')
+        self.setWindowIcon(QIcon(str( pathlib.Path(__file__).parent / 'images' / 'testchar_player.png' )))
+        self.grid = QGridLayout()
+        self.setLayout(self.grid)
+        label = QLabel()
+        label.setText(text)
+        self.grid.addWidget(label, 0, 0)
+        self.setWindowModality(Qt.ApplicationModal)
@@ -2,24 +2,96 @@
 The source class of the game.
 Holds all vital information.
 '''
+import itertools
+import random
+
 from game_enums import PlayerColor
 import player
 from board import Board
+import zobrist
 import ai.game_ai_1 as game_ai_1
 import ai.game_ai_2 as game_ai_2
 import ai.game_ai_3 as game_ai_3
 import ai.game_ai_4 as game_ai_4
-import copy
+import ai.search as search
+
+# Identifiers of the games created in this process; copies of a game keep the identifier of the original
+game_ids = itertools.count()
+
+
+class GameSnapshot:
+    '''
+    A structural snapshot of the mutable game state: whose turn it is, the players' character lists and flags,
+    the characters' squares, HP, stats, skills, statuses and readiness. Created with Game.snapshot() and restored
+    with Game.restore(); much cheaper than a deep copy of the whole game.
+    '''
+    def __init__(self, game):
+        self.whose_turn = game.whose_turn
+        self.turn_number = game.turn_number
+        self.players    = [ (player, list(player.characters), player.alive, player.won, player.lost, player.first, player.vip)
+                            for player in game.players.values() ]
+        self.positions  = dict(game.board.positions)
+        chars = set(self.positions)
+        for player in game.players.values():
+            chars.update(player.characters)
+        self.characters = [ (char, char.hp, char.alive, char.ready, char.init_square, dict(char.stats), list(char.skills),
+                             [(sk, sk.use_count, sk.has_ended) for sk in char.skills], char.carried, char.carrying, char.status)
+                            for char in chars ]
+
 
 class Game:
     
-    def __init__(self, blue_controlled_by_ai=False, red_controlled_by_ai=True):
+    def __init__(self, blue_controlled_by_ai=False, red_controlled_by_ai=True, seed=None):
+        '''
+        @param seed: Seed for the game's random numbers (see seed()), or None for an unpredictable game
+        '''
         self.board      = Board()  # Board object
         self.players    = {  
                             PlayerColor.BLUE : player.create_new_player(color=PlayerColor.BLUE, ai_controlled=blue_controlled_by_ai, ai_func=game_ai_4.get_move),
                             PlayerColor.RED  : player.create_new_player(color=PlayerColor.RED,  ai_controlled=red_controlled_by_ai,  ai_func=game_ai_4.get_move)
                           }
         self.whose_turn = PlayerColor.BLUE
+        self.turn_number = 0                # Number of turn changes so far
+        self.game_id    = next(game_ids)    # Identifies the game in the caches of the AI
+        self.seed       = None
+        self.rng        = random.Random()   # All random numbers of the game and its AIs are drawn from this
+        self.set_seed(seed)
+        self.confirm_attack = None  # Function (user, attack, target) -> bool asking a human player to confirm an attack
+        self.confirm_skill  = None  # Function (user, skill, info) -> bool asking a human player to confirm a skill
+
+    def __getstate__(self):
+        '''
+        The confirmation callbacks belong to the user interface, so they are not pickled: copies of the game
+        (e.g. the ones the AI uses) never ask for confirmation.
+        '''
+        state = dict(self.__dict__)
+        state['confirm_attack'] = None
+        state['confirm_skill']  = None
+        return state
+
+    def set_confirmation(self, confirm_attack=None, confirm_skill=None):
+        '''
+        Sets the functions which ask a human player to confirm the attacks and the skills before they are used.
+        Without them (e.g. when the game is played without the GUI), the actions are used without asking.
+        @param confirm_attack: Function (user, attack, target) returning True if the attack is to be done
+        @param confirm_skill:  Function (user, skill, info) returning True if the skill is to be used; info is
+                               a string describing the effect
+        '''
+        self.confirm_attack = confirm_attack
+        self.confirm_skill  = confirm_skill
+
+    def confirm(self, user, action, target):
+        '''
+        Asks the confirmation callback whether a human player's character may use an attack or a skill.
+        @param target: Target character of an attack, or the info string of a skill
+        @return: True if the action is to be used
+        '''
+        if user.get_owner().is_ai():
+            return True
+        callback = self.confirm_skill if action.get_action_type() == 's' else self.confirm_attack
+        if callback is None:
+            return True
+        return bool(callback(user, action, target))
 
 
     def move_character(self, char, target_coordinates, verbose=True):
@@ -43,11 +115,105 @@ class Game:
         char.set_ready()
 
     def ai_make_turn(self, verbose=True):
+        '''
+        Lets the AI choose a move and applies it.
+        '''
         if self.players[self.whose_turn].is_ai():
-            game_copy = copy.deepcopy(self)
-            move = self.get_current_player().ai_func(game_copy, self.whose_turn)
+            move = self.ai_get_move()
             self.apply_move(move, verbose=verbose)
 
+    def ai_get_move(self, control=None):
+        '''
+        Lets the AI of the current player choose a move, and returns it without applying it. The AI searches on
+        this game; whatever it changes while searching is reverted from a snapshot before returning.
+        @param control: ai.search.SearchControl given to the AI function if it accepts one, so that the search can
+                        be cancelled or its progress followed (optional)
+        '''
+        ai_func = self.get_current_player().ai_func
+        snapshot = self.snapshot()
+        try:
+            if control is not None and search.accepts_argument(ai_func, 'control'):
+                return ai_func(self, self.whose_turn, control=control)
+            return ai_func(self, self.whose_turn)
+        finally:
+            self.restore(snapshot)
+
+    def make_move(self, move, verbose=False):
+        '''
+        Applies the move as apply_move does, and returns an undo record.
+        @param move: Move object to apply
+        @return: Undo record which unmake_move takes to revert the game exactly to the state before the move
+        '''
+        snapshot = self.snapshot()
+        try:
+            self.apply_move(move, verbose=verbose)
+        except Exception:
+            self.restore(snapshot)
+            raise
+        return snapshot
+
+    def unmake_move(self, undo):
+        '''
+        Reverts a move applied with make_move.
+        @param undo: The undo record make_move returned
+        '''
+        self.restore(undo)
+
+    def snapshot(self):
+        '''
+        Returns a GameSnapshot of the current state, which can be given to restore.
+        '''
+        return GameSnapshot(self)
+
+    def restore(self, snapshot):
+        '''
+        Restores the game to the state it was in when the snapshot was taken.
+        Only characters whose square has changed are moved on the board.
+        @param snapshot: GameSnapshot from Game.snapshot()
+        '''
+        self.whose_turn = snapshot.whose_turn
+        self.turn_number = snapshot.turn_number
+        for player, characters, alive, won, lost, first, vip in snapshot.players:
+            player.characters = list(characters)
+            player.alive, player.won, player.lost = alive, won, lost
+            player.first, player.vip = first, vip
+
+        # Pick up every object that is not where it should be, then place them back
+        board = self.board
+        if board.positions != snapshot.positions:
+            for object, square in list(board.positions.items()):
+                if snapshot.positions.get(object) != square:
+                    board.remove_object(square)
+            for object, square in snapshot.positions.items():
+                if board.positions.get(object) != square:
+                    board.set_object(square, object)
+
+        for char, hp, alive, ready, init_square, stats, skills, skill_states, carried, carrying, status in snapshot.characters:
+            char.hp, char.alive, char.ready, char.init_square = hp, alive, ready, init_square
+            char.stats = dict(stats)
+            char.skills = list(skills)
+            for sk, use_count, has_ended in skill_states:
+                sk.use_count, sk.has_ended = use_count, has_ended
+            char.carried, char.carrying, char.status = carried, carrying, status
+            char.invalidate_stats()
+        board.refresh_hash()
+
+    def set_seed(self, seed):
+        '''
+        Seeds the random numbers of the game: the hit rolls of the attacks and the randomness of the AIs.
+        With the same seed, the same game is played the same way again, if the caches of the AI are emptied when
+        the game starts (see game_ai_4.reset_caches).
+        @param seed: Integer or string, or None to seed from the system's randomness
+        '''
+        self.seed = seed
+        self.rng.seed(seed)
+
+    def get_hash(self):
+        '''
+        Returns the Zobrist hash of the game state: the map, the objects on the board, their state and whose turn it is.
+        '''
+        return self.board.get_hash() ^ self.board.terrain_hash ^ zobrist.turn_hash(self.whose_turn)
+
     def apply_move(self, move, verbose=True):
             
         # Move character
@@ -74,14 +240,22 @@ class Game:
         if not self.get_current_player().is_ai():
             self.get_current_player().end_turn()
 
-    def change_turn(self):
+    def change_turn(self, verbose=True):
         if self.players[self.whose_turn].is_ready():
             self.players[self.whose_turn].set_all_not_ready()
             self.whose_turn = PlayerColor.BLUE if self.whose_turn == PlayerColor.RED else PlayerColor.RED
-            self.players[self.whose_turn].new_turn()
+            self.turn_number += 1
+            self.players[self.whose_turn].new_turn(verbose=verbose)
             return True
         return False
 
+    def get_turn_key(self):
+        '''
+        Returns a value identifying the current turn of this game, e.g. for the caches of the AI which are valid
+        for one turn only. Copies of the game (also the ones sent to other processes) give the same value.
+        '''
+        return (self.game_id, self.turn_number)
+
     def is_player_ready(self):
         if self.players[self.whose_turn].is_ready():
             return True
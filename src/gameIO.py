@@ -1,6 +1,6 @@
 from tile import *
 from game_errors import *
-from game_enums import PlayerColor
+from game_enums import PlayerColor, Terrain
 import character
 from game import Game
 import yaml
@@ -8,6 +8,18 @@ import yaml
 '''
 Functions to manage loading a game from and saving a game to file.
 '''
+
+# Symbol -> terrain, used for the map_keys section of the saves written by the game
+MAP_KEYS = {'_':'plain',
+            's':'sand',
+            '^':'forest',
+            'w':'water',
+            '+':'mountain',
+            'X':'wall',
+            'o':'snow',
+            'T':'wood',
+            'G':'goal'}
+
     
 def load_game(input_file):
     try:
@@ -47,13 +59,15 @@ def load_game_with_new_format(input_file):
     game = Game(blue_controlled_by_ai=blue_ai, red_controlled_by_ai=red_ai)
 
     # Construct map
-    map = [[new_tile(data['map_keys'][sym], game) for sym in row if sym.rstrip() != ''] for row in data['map'].split('\n') if len(row) > 0]
+    map = [[new_tile(data['map_keys'][sym]) for sym in row if sym.rstrip() != ''] for row in data['map'].split('\n') if len(row) > 0]
     game.board.set_board(map)
 
     # Set other game settings
     if 'whose_turn' in data['game']:
         if data['game']['whose_turn'].lower() in ('red', 'r'):
             game.whose_turn = PlayerColor.RED
+    if 'seed' in data['game']:
+        game.set_seed(data['game']['seed'])
 
     # Load characters
     for char_data in data['characters']:
@@ -198,7 +212,7 @@ def load_game_with_old_format(input_file):
                 line = []
                 for sign in current_line:
                     type = keys[sign]
-                    tile = new_tile(type, game)
+                    tile = new_tile(type)
                     line.append(tile)
                 map.append(line)
                 
@@ -279,31 +293,14 @@ def load_game_with_old_format(input_file):
     return game
 
 
-def new_tile(key, game):
+def new_tile(key):
     '''
-    Method creates a new tile according to key it gets.
+    Method returns the shared tile of the terrain named by the key it gets; unknown keys give a plain tile.
     '''
-    if key.lower() == "plain":
-        tile = Plain(game)
-    elif key.lower() == "wall":
-        tile = Wall(game)
-    elif key.lower() == "sand":
-        tile = Sand(game)
-    elif key.lower() == "mountain":
-        tile = Mountain(game)
-    elif key.lower() == "forest":
-        tile = Forest(game)
-    elif key.lower() == "water":
-        tile = Water(game)
-    elif key.lower() == "snow":
-        tile = Snow(game)
-    elif key.lower() == "wood":
-        tile = Wood(game)
-    elif key.lower() == "goal":
-        tile = Goal(game)
-    else:
-        tile = Plain(game)
-    return tile
+    key = key.lower()
+    if key not in TERRAIN_TO_TILE:
+        key = Terrain.PLAIN
+    return terrain_tile(key)
 
     
 def set_width(width, previous_width):
@@ -330,15 +327,12 @@ def save_game(game, filename):
     game_section['whose_turn'] = 'blue' if game.whose_turn == PlayerColor.BLUE else 'red'
     game_section['blue_control'] = 'ai' if game.get_blue_player().ai else 'player'
     game_section['red_control'] = 'ai' if game.get_red_player().ai else 'player'
+    if game.seed is not None:
+        game_section['seed'] = game.seed
     savedata['game'] = game_section
     
     # map_keys section
-    sym2tile = {'_':'plain',
-            's':'sand',
-            '^':'forest',
-            'w':'water',
-            '+':'mountain',
-            'X':'wall'}
+    sym2tile = dict(MAP_KEYS)
     savedata['map_keys'] = sym2tile
 
     tile2sym = {}
@@ -347,9 +341,10 @@ def save_game(game, filename):
 
     # Parse through the map tiles (map section)
     map_str = ''
-    for row in game.board.board:
-        for tile in row:
-            sym = tile2sym[tile.terrain]
+    board = game.board
+    for y in range(board.height):
+        for x in range(board.width):
+            sym = tile2sym[board.get_terrain((x,y)).terrain]
             map_str += sym
         map_str += '\n'
     savedata['map'] = map_str
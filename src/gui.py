@@ -9,10 +9,14 @@ import sys
 import configload
 from character import Character
 from game_errors import IllegalMoveException, CorruptedMapDataException,\
-    CorruptedSaveFileException, ErrorWindow
+    CorruptedSaveFileException
+from confirmwindow import ErrorWindow, confirm_attack, confirm_skill
 from infowindow import Infowindow
 from action import Action
+from aithread import AIThread
 import gameIO
+import profiling
+import ai.game_ai_4 as game_ai_4
 from game_enums import PlayerColor
 
 class ActionStorage:
@@ -63,6 +67,8 @@ class GUI(QMainWindow):
 
         self.action_storage = ActionStorage()
         self.active_character = None
+        self.ai_thread = None
+        app.aboutToQuit.connect(self.stop_ai_turn)
         
         self.setWindowTitle('Strategiapeli')
         self.infownd = Infowindow(self)
@@ -80,8 +86,9 @@ class GUI(QMainWindow):
         '''
         Initializes the view and class members based on the self.game object
         '''
+        game_ai_4.reset_caches()
+        self.game.set_confirmation(confirm_attack, confirm_skill)
         self.initUI()
-        self.refresh_map()
         self.infownd.close()
         self.infownd = Infowindow(self)
         self.setGeometry(self.x, self.y, GUI.SQUARE_SIZE*self.game.get_board().get_width()+50, GUI.SQUARE_SIZE*self.game.get_board().get_height()+90)
@@ -135,7 +142,8 @@ class GUI(QMainWindow):
                 row.append(square)
             self.view.gui_tiles.append(row)
 
-        self.refresh_map()
+        self.highlighted = set()    # Squares painted by the recolor_map methods
+        self.refresh_map(full=True)
 
                 
     def char_info(self):
@@ -184,6 +192,19 @@ class GUI(QMainWindow):
         endTurnAction.setStatusTip('End your turn')
         endTurnAction.triggered.connect(self.set_all_ready)
 
+        cancelAiAction = QAction('&Cancel AI turn',self)
+        cancelAiAction.setShortcut('Esc')
+        cancelAiAction.setStatusTip('Stop the computer from thinking')
+        cancelAiAction.triggered.connect(self.cancel_ai_turn)
+
+        profileAction = QAction('&Profile AI', self, checkable=True)
+        profileAction.setStatusTip('Measure where the time of the AI turns goes')
+        profileAction.toggled.connect(self.set_profiling)
+
+        reportAction = QAction('AI profiling &report', self)
+        reportAction.setStatusTip('Print the profiling report of the AI turns to the console')
+        reportAction.triggered.connect(self.print_profiling_report)
+
         self.statusBar()
 
         menubar = self.menuBar()
@@ -191,59 +212,70 @@ class GUI(QMainWindow):
         gameMenu.addAction(saveAction)
         gameMenu.addAction(loadAction)
         gameMenu.addAction(endTurnAction)
+        gameMenu.addAction(cancelAiAction)
         gameMenu.addAction(exitAction)
 
         viewMenu = menubar.addMenu('&Show')
         viewMenu.addAction(infowndAction)
+        viewMenu.addSeparator()
+        viewMenu.addAction(profileAction)
+        viewMenu.addAction(reportAction)
                 
                     
-    def refresh_map(self):
+    def refresh_map(self, full=False):
         '''
         Method refreshes the map: all tiles are recolored back to normal,
         and characters are printed to their current tile.
+        Only the squares which have changed on the board since the last refresh (see Board.take_dirty)
+        and the highlighted squares are drawn again, so the time depends on the change, not on the size of the map.
+        @param full: True if every square is drawn again, e.g. when the map has just been created
+        '''
+        board = self.game.get_board()
+        squares = board.take_dirty()
+        if full:
+            squares = [ (x,y) for y in range(board.get_height()) for x in range(board.get_width()) ]
+        else:
+            squares |= self.highlighted
+        self.highlighted = set()
+
+        for x, y in squares:
+            tile = board.get_tile((x,y))
+            square = self.view.gui_tiles[y][x]
+            square.setBrush(to_qcolor(tile.get_color()))
+
+            square.destroy_image()
+            char = tile.get_object()
+            if char != None:
+                if char.get_carrying():
+                    square.set_image(self.add_image(char.get_carrying(), x, y), False)
+                square.set_image(self.add_image(char, x, y), False)
+
+    def add_image(self, char, x, y):
         '''
-        for y in range(self.game.get_board().get_height()):
-            for x in range(self.game.get_board().get_width()):
-                tile = self.game.get_board().get_tile((x,y))
-                color = tile.get_color()
-                #square = tile.get_gui_tile()
-                square = self.view.gui_tiles[y][x]
-                square.setBrush(color)
-
-                square.destroy_image()
-                                
-                if tile.get_object() != None:
-                    empty_square = True
-                    char = tile.get_object()
-
-                    if char.get_carrying():
-                        photo = Image(char.get_carrying())
-                        pm = self.scene.addPixmap(photo)
-                        #tile.get_gui_tile().set_image(pm,True)
-                        pm.setPos(x*GUI.SQUARE_SIZE+1,y*GUI.SQUARE_SIZE+1)
-                        empty_square = False
-                    
-                    photo = Image(char)
-                    
-                    pm = self.scene.addPixmap(photo)
-                    
-                    #tile.get_gui_tile().set_image(pm, empty_square)
-                    square.set_image(pm, empty_square)
-                    pm.setPos(x*GUI.SQUARE_SIZE+1,y*GUI.SQUARE_SIZE+1)
-        
-                    
+        Adds the character's image to the scene on square (x,y), and returns the pixmap item.
+        '''
+        pm = self.scene.addPixmap(get_pixmap(char))
+        pm.setPos(x*GUI.SQUARE_SIZE+1,y*GUI.SQUARE_SIZE+1)
+        return pm
+
+    def highlight(self, squares, get_color):
+        '''
+        Paints the squares with the color given by get_color(tile); they are painted back to normal
+        on the next refresh_map.
+        '''
+        for coordinates in squares:
+            tile = self.game.get_board().get_tile(coordinates)
+            gui_tile = self.view.gui_tiles[coordinates[1]][coordinates[0]]
+            gui_tile.setBrush(to_qcolor(get_color(tile)))
+            self.highlighted.add((coordinates[0], coordinates[1]))
+
     def recolor_map_move(self,squares):
         '''
         Shows where character can move to.
         @param squares: List of squares in (x,y)-format.
         These are the squares we try to paint again.
         '''
-        for coordinates in squares:
-            tile = self.game.get_board().get_tile(coordinates)
-            gui_tile = self.view.gui_tiles[coordinates[1]][coordinates[0]]
-            #gui_tile = tile.get_gui_tile()
-            color = tile.get_color2()
-            gui_tile.setBrush(color)
+        self.highlight(squares, lambda tile: tile.get_color2())
 
 
     def recolor_map_attack(self,squares):
@@ -252,12 +284,7 @@ class GUI(QMainWindow):
         @param squares: List of squares in (x,y)-format.
         These are the squares we try to paint again.
         '''
-        for coordinates in squares:
-            tile = self.game.get_board().get_tile(coordinates)
-            #gui_tile = tile.get_gui_tile()
-            gui_tile = self.view.gui_tiles[coordinates[1]][coordinates[0]]
-            color = tile.get_color_attack()
-            gui_tile.setBrush(color)
+        self.highlight(squares, lambda tile: tile.get_color_attack())
             
     def recolor_map_skill(self,squares):
         '''
@@ -265,12 +292,7 @@ class GUI(QMainWindow):
         @param squares: List of squares in (x,y)-format.
         These are the squares we try to paint again.
         '''
-        for coordinates in squares:
-            tile = self.game.get_board().get_tile(coordinates)
-            #gui_tile = tile.get_gui_tile()
-            gui_tile = self.view.gui_tiles[coordinates[1]][coordinates[0]]
-            color = tile.get_color_skill()
-            gui_tile.setBrush(color)
+        self.highlight(squares, lambda tile: tile.get_color_skill())
             
     def load_file(self,*arg):
         '''
@@ -286,6 +308,9 @@ class GUI(QMainWindow):
         if fname[0] == '': #If canceled
             return
         try:
+            self.stop_ai_turn()
+            if configload.reload_if_modified():     # The settings and images apply from the next game on
+                pixmap_cache.clear()
             self.game = gameIO.load_game(fname[0])
             self.init_game()
 
@@ -351,6 +376,25 @@ class GUI(QMainWindow):
             self.game.end_turn()
             self.new_turn()
     
+    def set_profiling(self, enabled):
+        '''
+        Enables or disables the profiling of the AI turns.
+        '''
+        if enabled:
+            profiling.enable()
+        else:
+            profiling.disable()
+
+    def print_profiling_report(self):
+        '''
+        Prints the profiling reports of the last and all AI turns to the console.
+        '''
+        if not profiling.enabled and profiling.turns == 0:
+            self.statusBar().showMessage('Enable Show -> Profile AI first')
+            return
+        print(profiling.last_turn_report())
+        print(profiling.cumulative_report())
+
     def new_infownd(self):
         self.infownd.close()
         self.infownd = Infowindow(self)
@@ -395,6 +439,11 @@ class GUI(QMainWindow):
         '''
         self.infownd.refresh()
 
+        # Wait while the AI is thinking
+        if self.ai_thread is not None:
+            self.statusBar().showMessage('Tietokone miettii... (Esc peruuttaa)')
+            return
+
         # Return if winner is already determined
         if self.game.is_game_over():
             self.declare_winner()
@@ -407,9 +456,7 @@ class GUI(QMainWindow):
         
         # If it's AI's turn, set it to do its turn independently
         if self.game.get_current_player().is_ai():
-            self.game.ai_make_turn()
-            self.refresh_map()
-            self.get_infownd().refresh()
+            self.start_ai_turn()
             return
         
         # Refresh map to remove all old highlightnings
@@ -459,6 +506,56 @@ class GUI(QMainWindow):
 
 
 
+    def start_ai_turn(self):
+        '''
+        Lets the AI choose its move in a separate thread. The move is applied in ai_move_found.
+        '''
+        self.ai_thread = AIThread(self.game, self)
+        self.ai_thread.progress.connect(self.ai_progress)
+        self.ai_thread.move_found.connect(self.ai_move_found)
+        self.statusBar().showMessage('Tietokone miettii... (Esc peruuttaa)')
+        self.ai_thread.start()
+
+    def ai_progress(self, done, total):
+        if self.sender() is self.ai_thread:
+            self.statusBar().showMessage(f'Tietokone miettii... {done}/{total} siirtoa arvioitu (Esc peruuttaa)')
+
+    def ai_move_found(self, move):
+        '''
+        Applies the move the AI has chosen, unless the AI turn has been cancelled.
+        '''
+        thread = self.sender()
+        if thread is not self.ai_thread:
+            return  # The game has changed since the thread was started
+        thread.wait()
+        self.ai_thread = None
+        if move is None or thread.is_cancelled():
+            self.statusBar().showMessage('Tietokoneen siirto peruttiin. (Klikkaa karttaa jatkaaksesi)')
+            return
+        thread.apply_to(self.game)
+        self.refresh_map()
+        self.get_infownd().refresh()
+        self.statusBar().showMessage('Tietokoneen vuoro... (Klikkaa karttaa edetaksesi)')
+        if self.game.is_game_over():
+            self.declare_winner()
+
+    def cancel_ai_turn(self):
+        '''
+        Asks the AI to stop thinking. Its move is not applied; clicking the map starts the AI turn again.
+        '''
+        if self.ai_thread is not None:
+            self.ai_thread.cancel()
+            self.statusBar().showMessage('Perutaan...')
+
+    def stop_ai_turn(self):
+        '''
+        Cancels the AI turn and waits for the thread to stop, e.g. before the game is replaced.
+        '''
+        if self.ai_thread is not None:
+            self.ai_thread.cancel()
+            self.ai_thread.wait()
+            self.ai_thread = None
+
     def new_turn(self):
         '''
         Method prints needed information into the console and then tries to change the turn between players.
@@ -575,15 +672,33 @@ class GUI(QMainWindow):
                     
                 
                 
-class Image(QPixmap):
+# (r,g,b) -> QColor of the tile colors used so far
+qcolor_cache = {}
+
+def to_qcolor(rgb):
     '''
-    Image of a character on the map.
-    In addition to the pixmap, holds information of the character it depicts.
+    Returns the tile color given as (r,g,b) (see tile.TERRAIN_COLORS) as a QColor.
     '''
-    
-    def __init__(self,char):
-        super().__init__(char.get_path())
-        self.char = char
+    color = qcolor_cache.get(rgb)
+    if color is None:
+        color = QColor(*rgb)
+        qcolor_cache[rgb] = color
+    return color
+
+
+# Path of the image file -> QPixmap of the character images loaded so far, shared by all windows
+pixmap_cache = {}
+
+def get_pixmap(char):
+    '''
+    Returns the image of the character as it is drawn on the map. Each image file is loaded only once.
+    '''
+    path = char.get_path()
+    pixmap = pixmap_cache.get(path)
+    if pixmap is None:
+        pixmap = QPixmap(path)
+        pixmap_cache[path] = pixmap
+    return pixmap
         
         
         
@@ -15,4 +15,5 @@ def main():
     app = QApplication(sys.argv)
     gui = GUI()
 
-main()
+if __name__ == '__main__':
+    main()
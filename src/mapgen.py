@@ -0,0 +1,194 @@
+'''
+Procedural map generator: writes new-format YAML saves of any size, for testing how the game and the AIs scale.
+The same parameters and seed always give the same map.
+Run from the src directory, e.g. with
+    python -m mapgen ../savedata/large.yaml --size 64 --units 50 --seed 1
+    python -m mapgen map.yaml --size 128 96 --walls 0.1 --terrain forest=0.2 water=0 --roster knight archer
+'''
+import argparse
+from collections import deque
+import random
+
+from character import CHARACTER_CLASS_TO_CHARACTER
+from game_enums import CharacterClass, Terrain
+from gameIO import MAP_KEYS
+
+
+# Terrain -> relative share of the squares. Walls are placed separately, see 'wall_density'.
+DEFAULT_TERRAIN = {
+    Terrain.PLAIN       : 0.60,
+    Terrain.FOREST      : 0.12,
+    Terrain.SAND        : 0.08,
+    Terrain.MOUNTAIN    : 0.08,
+    Terrain.WATER       : 0.06,
+    Terrain.SNOW        : 0.06,
+    Terrain.GOAL        : 0.00,
+}
+DEFAULT_WALL_DENSITY    = 0.05
+DEFAULT_ROSTER          = [ char_class for char_class in CHARACTER_CLASS_TO_CHARACTER if char_class != CharacterClass.TESTCHAR ]
+
+# Terrains no character can move through without a skill
+BLOCKING = (Terrain.WATER, Terrain.WALL)
+
+# Width of the cells in which the centres of the terrain areas are placed
+AREA_SIZE = 4
+
+
+def generate_terrain(width, height, rng, terrain=DEFAULT_TERRAIN, wall_density=DEFAULT_WALL_DENSITY):
+    '''
+    Returns the terrain of a map as a list of rows of Terrain values. The terrain forms areas: every square gets the
+    terrain of the nearest area centre, and each cell of AREA_SIZE x AREA_SIZE squares has one centre. Single walls
+    are then scattered with the probability 'wall_density'.
+    '''
+    terrains = [ t for t, share in terrain.items() if share > 0 ]
+    weights  = [ terrain[t] for t in terrains ]
+    if len(terrains) == 0:
+        terrains, weights = [Terrain.PLAIN], [1]
+
+    cells_x = (width + AREA_SIZE - 1) // AREA_SIZE
+    cells_y = (height + AREA_SIZE - 1) // AREA_SIZE
+    centres = {}    # Cell -> (x, y, terrain) of its centre
+    for cy in range(cells_y):
+        for cx in range(cells_x):
+            x = cx*AREA_SIZE + rng.random()*AREA_SIZE
+            y = cy*AREA_SIZE + rng.random()*AREA_SIZE
+            centres[(cx,cy)] = (x, y, rng.choices(terrains, weights)[0])
+
+    rows = []
+    for y in range(height):
+        row = []
+        for x in range(width):
+            cx, cy = x // AREA_SIZE, y // AREA_SIZE
+            best, best_terrain = None, Terrain.PLAIN
+            for ny in range(cy-1, cy+2):
+                for nx in range(cx-1, cx+2):
+                    centre = centres.get((nx,ny))
+                    if centre is None:
+                        continue
+                    distance = (centre[0]-x-0.5)**2 + (centre[1]-y-0.5)**2
+                    if best is None or distance < best:
+                        best, best_terrain = distance, centre[2]
+            row.append(Terrain.WALL if rng.random() < wall_density else best_terrain)
+        rows.append(row)
+    return rows
+
+
+def deployment_squares(rows, corner, count, excluded=()):
+    '''
+    Returns the 'count' squares nearest to 'corner', which are turned into plain squares for the characters to start on.
+    @param excluded: Squares which are not used, e.g. the deployment squares of the other player
+    '''
+    width, height = len(rows[0]), len(rows)
+    excluded = set(excluded)
+    squares = sorted(((x,y) for y in range(height) for x in range(width) if (x,y) not in excluded),
+                     key=lambda square: (abs(square[0]-corner[0]) + abs(square[1]-corner[1]), square[1], square[0]))
+    if len(squares) < count:
+        raise ValueError(f"{count} characters do not fit on the {len(squares)} free squares of the map")
+    squares = squares[:count]
+    for x, y in squares:
+        rows[y][x] = Terrain.PLAIN
+    return squares
+
+
+def connect(rows, source, target):
+    '''
+    Makes sure that 'target' can be reached from 'source' without crossing water or walls: if it cannot, the
+    blocking squares along a straight path (first horizontally, then vertically) are turned into plain squares.
+    '''
+    width, height = len(rows[0]), len(rows)
+    seen = {source}
+    q = deque([source])
+    while q:
+        x, y = q.popleft()
+        if (x,y) == target:
+            return
+        for nx, ny in ((x+1,y), (x-1,y), (x,y+1), (x,y-1)):
+            if 0 <= nx < width and 0 <= ny < height and (nx,ny) not in seen and rows[ny][nx] not in BLOCKING:
+                seen.add((nx,ny))
+                q.append((nx,ny))
+
+    x, y = source
+    while (x,y) != target:
+        if x != target[0]:
+            x += 1 if target[0] > x else -1
+        else:
+            y += 1 if target[1] > y else -1
+        if rows[y][x] in BLOCKING:
+            rows[y][x] = Terrain.PLAIN
+
+
+def generate(width, height, seed=None, units=10, terrain=DEFAULT_TERRAIN, wall_density=DEFAULT_WALL_DENSITY, roster=DEFAULT_ROSTER):
+    '''
+    Generates a map and returns it as a save file string in the new format.
+    Both players get the same characters: blue starts in the top right corner and red in the bottom left one,
+    and there is always a path between them without water or walls.
+    @param units:        Number of characters per player
+    @param terrain:      Dictionary from Terrain to its relative share of the squares (walls excluded)
+    @param wall_density: Probability of a square being a wall
+    @param roster:       List of character classes (CharacterClass values) the characters are drawn from
+    @param seed:         Seed of the random numbers; it is also written as the seed of the game
+    '''
+    if units * 2 > width * height:
+        raise ValueError(f"{units} characters per player do not fit on a {width}x{height} map")
+    rng   = random.Random(seed)
+    rows  = generate_terrain(width, height, rng, terrain, wall_density)
+    chars = [ rng.choice(roster) for _ in range(units) ]
+    blue_squares = deployment_squares(rows, (width-1, 0), units)
+    red_squares  = deployment_squares(rows, (0, height-1), units, excluded=blue_squares)
+    connect(rows, blue_squares[0], red_squares[0])
+
+    terrain2sym = { t: sym for sym, t in MAP_KEYS.items() }
+    lines = ["game:",
+             "  mode:           deathmatch",
+             "  blue_control:   ai",
+             "  red_control:    ai",
+             "  whose_turn:     blue"]
+    if seed is not None:
+        lines.append(f"  seed:           {seed}")
+    lines += ["", "", "map_keys:"]
+    lines += [ f"  {sym}:    {t}" for sym, t in MAP_KEYS.items() ]
+    lines += ["", "", "map: |"]
+    lines += [ "  " + "".join(terrain2sym[t] for t in row) for row in rows ]
+    lines += ["", "", "characters:"]
+    for color, squares in (('Blue', blue_squares), ('Red', red_squares)):
+        for char_class, (x, y) in zip(chars, squares):
+            lines += [f"  - class: {char_class.capitalize()}",
+                      f"    color: {color}",
+                      f"    loc:   {x},{y}",
+                      ""]
+    return "\n".join(lines)
+
+
+def parse_terrain(values):
+    '''
+    Returns DEFAULT_TERRAIN updated with the shares given as strings of the form 'terrain=share'.
+    '''
+    terrain = dict(DEFAULT_TERRAIN)
+    for value in values:
+        name, share = value.split('=')
+        if name not in terrain:
+            raise ValueError(f"Unknown terrain '{name}', choose from {', '.join(terrain)}")
+        terrain[name] = float(share)
+    return terrain
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generates a random map as a save file.')
+    parser.add_argument('filename', help='save file to write')
+    parser.add_argument('--size', type=int, nargs='+', default=[32], help='width (and height, if different) of the map (default 32)')
+    parser.add_argument('--units', type=int, default=10, help='characters per player (default 10)')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the random numbers')
+    parser.add_argument('--walls', type=float, default=DEFAULT_WALL_DENSITY, help=f'probability of a square being a wall (default {DEFAULT_WALL_DENSITY})')
+    parser.add_argument('--terrain', nargs='*', default=[], help='relative shares of the terrains, e.g. forest=0.2 water=0')
+    parser.add_argument('--roster', nargs='+', default=DEFAULT_ROSTER, choices=DEFAULT_ROSTER, help='character classes to draw from')
+    args = parser.parse_args()
+
+    width  = args.size[0]
+    height = args.size[1] if len(args.size) > 1 else width
+    text = generate(width, height, args.seed, args.units, parse_terrain(args.terrain), args.walls, args.roster)
+    with open(args.filename, 'w') as file:
+        file.write(text)
+
+
+if __name__ == '__main__':
+    main()
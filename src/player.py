@@ -1,5 +1,3 @@
-import random
-
 class Player:
     
     def __init__(self, color):
@@ -63,13 +61,13 @@ class Player:
         '''
         self.vip = True
     
-    def new_turn(self):
+    def new_turn(self, verbose=True):
         '''
         Initialized all characters for new turn.
         Also on first turn adds skills to eveyone if it is a vip game.
         '''
         for char in self.characters:
-            char.new_turn()
+            char.new_turn(verbose=verbose)
 
         
     def end_turn(self):
@@ -114,7 +112,7 @@ class AI(Player):
                 not_ready.append(char)
                 
         size = len(not_ready)
-        next = random.randint(0,size-1)
+        next = not_ready[0].game.rng.randint(0,size-1)
         char = not_ready[next]
         char.ai_make_turn()
 
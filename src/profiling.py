@@ -0,0 +1,170 @@
+'''
+Opt-in profiling of the AI turns: wall-clock timers around the phases of an AI move, and call counters of the
+most frequently called helpers.
+
+The instrumentation is installed by enable(), which replaces the profiled functions with wrappers, and removed by
+disable(), which puts the original functions back. So when profiling is disabled, there is no overhead at all.
+The statistics are collected per AI turn (Game.ai_get_move, which Game.ai_make_turn calls) and added to
+cumulative totals. The times are inclusive, i.e. the time of a phase includes the phases called from it.
+Candidate moves evaluated in the AI's worker processes (setting 'workers' in section 'ai') are not profiled.
+'''
+import functools
+import time
+
+import ai.game_ai_4 as game_ai_4
+from attack import Attack
+from board import Board
+from character import Character
+from game import Game
+
+
+# (name, owner, attribute) of the functions whose calls are timed
+TIMED = [
+    ('Game.ai_get_move',                Game,       'ai_get_move'),
+    ('Game.snapshot',                   Game,       'snapshot'),
+    ('Game.restore',                    Game,       'restore'),
+    ('construct_player_threat_board',   game_ai_4,  'construct_player_threat_board'),
+    ('Character.get_legal_squares',     Character,  'get_legal_squares'),
+    ('apply_candidate_move',            game_ai_4,  'apply_candidate_move'),
+    ('get_heuristic_board_value',       game_ai_4,  'get_heuristic_board_value'),
+]
+
+# (name, owner, attribute) of the functions whose calls are only counted, as they are too cheap to time
+COUNTED = [
+    ('Board.get_square',                Board,      'get_square'),
+    ('Character.get_stats',             Character,  'get_stats'),
+    ('Attack.calculate_damage',         Attack,     'calculate_damage'),
+    ('Attack.calculate_accuracy',       Attack,     'calculate_accuracy'),
+    ('Attack.calculate_max_damage',     Attack,     'calculate_max_damage'),
+    ('Attack.calculate_probable_damage',Attack,     'calculate_probable_damage'),
+]
+
+enabled     = False
+originals   = {}    # (owner, attribute) -> the original function
+turn        = {}    # Name -> [calls, seconds] during the current turn
+last_turn   = {}    # Name -> [calls, seconds] during the last finished turn
+cumulative  = {}    # Name -> [calls, seconds] of all finished turns
+turns       = 0     # Number of finished turns
+
+
+def timed(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            entry = turn.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += time.perf_counter() - start
+    return wrapper
+
+
+def counted(name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        entry = turn.setdefault(name, [0, None])
+        entry[0] += 1
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def timed_turn(func):
+    '''
+    Wraps Game.ai_get_move so that the statistics are collected per turn.
+    '''
+    wrapper = timed('Game.ai_get_move', func)
+    @functools.wraps(func)
+    def turn_wrapper(*args, **kwargs):
+        turn.clear()
+        try:
+            return wrapper(*args, **kwargs)
+        finally:
+            end_turn()
+    return turn_wrapper
+
+
+def merge(target, source):
+    for name, (calls, seconds) in source.items():
+        entry = target.setdefault(name, [0, None if seconds is None else 0.0])
+        entry[0] += calls
+        if seconds is not None:
+            entry[1] += seconds
+
+
+def end_turn():
+    global last_turn, turns
+    last_turn = { name: list(entry) for name, entry in turn.items() }
+    merge(cumulative, turn)
+    turn.clear()
+    turns += 1
+
+
+def enable():
+    '''
+    Installs the instrumentation. Does nothing if it is already installed.
+    '''
+    global enabled
+    if enabled:
+        return
+    for name, owner, attribute in TIMED + COUNTED:
+        func = getattr(owner, attribute)
+        originals[(owner, attribute)] = func
+        if attribute == 'ai_get_move':
+            wrapper = timed_turn(func)
+        elif (name, owner, attribute) in TIMED:
+            wrapper = timed(name, func)
+        else:
+            wrapper = counted(name, func)
+        setattr(owner, attribute, wrapper)
+    enabled = True
+
+
+def disable():
+    '''
+    Removes the instrumentation and restores the original functions. The collected statistics are kept.
+    '''
+    global enabled
+    for (owner, attribute), func in originals.items():
+        setattr(owner, attribute, func)
+    originals.clear()
+    enabled = False
+
+
+def reset():
+    '''
+    Clears the collected statistics.
+    '''
+    global last_turn, turns
+    turn.clear()
+    last_turn = {}
+    cumulative.clear()
+    turns = 0
+
+
+def report(stats, title):
+    '''
+    Returns the statistics as a printable table, sorted by the time used.
+    '''
+    lines = [title, f"  {'':<34} {'calls':>9} {'total ms':>10} {'ms/call':>9}"]
+    order = sorted(stats.items(), key=lambda item: (item[1][1] is None, -(item[1][1] or 0), -item[1][0]))
+    for name, (calls, seconds) in order:
+        if seconds is None:
+            lines.append(f"  {name:<34} {calls:>9} {'-':>10} {'-':>9}")
+        else:
+            lines.append(f"  {name:<34} {calls:>9} {1000*seconds:>10.1f} {1000*seconds/max(1,calls):>9.3f}")
+    return '\n'.join(lines)
+
+
+def last_turn_report():
+    '''
+    Returns the report of the last AI turn.
+    '''
+    return report(last_turn, 'Last AI turn:')
+
+
+def cumulative_report():
+    '''
+    Returns the report of all AI turns since the statistics were last reset.
+    '''
+    return report(cumulative, f'All AI turns ({turns}):')
@@ -0,0 +1,127 @@
+'''
+Headless simulation: plays full AI-vs-AI games without the GUI, so PyQt5 is not needed.
+Run from the src directory, e.g. with
+    python -m simulate [save file] [--blue game_ai_4] [--red game_ai_5] [--seed 1] [--max-turns 200] [--profile]
+'''
+import argparse
+import importlib
+import time
+
+import configload
+import gameIO
+import profiling
+import ai.game_ai_4 as game_ai_4
+import ai.search as search
+from game_enums import PlayerColor
+
+
+DEFAULT_AI        = 'game_ai_4'
+DEFAULT_MAX_TURNS = 200
+
+
+class GameResult:
+    '''
+    Result of one simulated game.
+    '''
+    def __init__(self) -> None:
+        self.winner     = None  # PlayerColor of the winner, or None if the game was not finished within the turn limit
+        self.turns      = 0     # Number of player turns played
+        self.move_times = []    # List of (player color, seconds the AI used for the move), in the order of the moves
+
+    def get_move_times(self, color):
+        '''
+        Returns a list of the times (in seconds) the given player's AI used for its moves.
+        '''
+        return [ t for move_color, t in self.move_times if move_color == color ]
+
+    def __repr__(self) -> str:
+        winner = self.winner if self.winner is not None else 'none'
+        return f"Winner: {winner}, turns: {self.turns}, moves: {len(self.move_times)}"
+
+
+def load_ai(name):
+    '''
+    Returns the get_move function of an AI module.
+    @param name: Name of the module in the ai package, e.g. 'game_ai_4' (or 'ai.game_ai_4')
+    '''
+    if not name.startswith('ai.'):
+        name = 'ai.' + name
+    return importlib.import_module(name).get_move
+
+
+def play_game(filename, blue_ai=DEFAULT_AI, red_ai=DEFAULT_AI, max_turns=DEFAULT_MAX_TURNS, seed=None, verbose=False, budget=None):
+    '''
+    Loads the game saved in 'filename' and lets the AIs play it to the end, or until 'max_turns' turns have been played.
+    Both players are controlled by an AI, whatever the save file says.
+    @param blue_ai, red_ai: AI module names (see load_ai) or get_move-style functions
+    @param seed:            Seed for the random numbers of the game (see Game.set_seed), or None to use the seed
+                            of the save file, if it has one
+    @param verbose:         True if the moves and their times are printed, and the profiling report of each
+                            move if profiling is enabled
+    @param budget:          Time budget per move in seconds, or None for no limit. The AIs are then run with
+                            ai.search.make_ai_func, which deepens their search until the time runs out.
+    @return: GameResult
+    '''
+    game = gameIO.load_game(filename)
+    if seed is not None:
+        game.set_seed(seed)
+    game_ai_4.reset_caches()
+    for color, ai_func in ((PlayerColor.BLUE, blue_ai), (PlayerColor.RED, red_ai)):
+        player = game.get_player(color)
+        player.ai = True
+        player.ai_func = load_ai(ai_func) if isinstance(ai_func, str) else ai_func
+        if budget is not None:
+            player.ai_func = search.make_ai_func(player.ai_func, budget)
+
+    result = GameResult()
+    result.turns = 1
+    while not game.is_game_over():
+        if game.is_player_ready():
+            if result.turns >= max_turns:
+                break
+            game.change_turn(verbose=False)
+            result.turns += 1
+            continue
+        start = time.perf_counter()
+        game.ai_make_turn(verbose=False)
+        elapsed = time.perf_counter() - start
+        result.move_times.append((game.whose_turn, elapsed))
+        if verbose:
+            print(f"Turn {result.turns}, {game.whose_turn}: {elapsed*1000:.1f} ms")
+            if profiling.enabled:
+                print(profiling.last_turn_report())
+
+    result.winner = game.get_winner()
+    return result
+
+
+def print_result(result):
+    print(result)
+    for color in (PlayerColor.BLUE, PlayerColor.RED):
+        times = result.get_move_times(color)
+        if len(times) > 0:
+            print(f"  {color}: {len(times)} moves, mean {sum(times)/len(times)*1000:.1f} ms, max {max(times)*1000:.1f} ms, total {sum(times):.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays an AI-vs-AI game without the GUI.')
+    parser.add_argument('filename', nargs='?', default=configload.get_filepath('savedata', 'save_yaml.yaml'), help='save file to load')
+    parser.add_argument('--blue', default=DEFAULT_AI, help=f'AI module of the blue player (default {DEFAULT_AI})')
+    parser.add_argument('--red', default=DEFAULT_AI, help=f'AI module of the red player (default {DEFAULT_AI})')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the random numbers')
+    parser.add_argument('--max-turns', type=int, default=DEFAULT_MAX_TURNS, help=f'maximum number of turns (default {DEFAULT_MAX_TURNS})')
+    parser.add_argument('--budget', type=float, default=None, help='time budget per move in seconds (default: no limit)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print every move and its time')
+    parser.add_argument('--profile', action='store_true', help='profile the phases of the AI moves and print a report')
+    args = parser.parse_args()
+
+    if args.profile:
+        profiling.enable()
+    result = play_game(args.filename, args.blue, args.red, args.max_turns, args.seed, args.verbose, args.budget)
+    print_result(result)
+    if args.profile:
+        print(profiling.cumulative_report())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,5 @@
 from game_enums import Stats
 from game_errors import IllegalMoveException
-from confirmwindow import ConfirmSkill
 from game_enums import CharacterClass, SkillType
 
 '''
@@ -89,8 +88,10 @@ class Skill:
         self.use_count += delta
         if self.use_count >= abs(self.max_uses):
             self.has_ended = True
+        self.char.invalidate_stats()
+        self.char.update_hash()
     
-    def new_turn(self):
+    def new_turn(self, verbose=True):
         return
     
     def get_stats(self, stats):
@@ -103,7 +104,6 @@ class Skill:
         return damage
         
         
-#from action import ConfirmSkill        
 
 class Ghost(Skill):
     '''
@@ -174,11 +174,8 @@ class Heal(Skill):
         maxhp = target.get_maxhp()
         if hp + heal > maxhp:
             heal = maxhp - hp
-        if not self.char.get_owner().is_ai():
-            string = "Heal amount: " + str(heal)
-            wnd = ConfirmSkill(self.char,self,string)
-            if not wnd.exec_():
-                return
+        if not self.char.get_game().confirm(self.char, self, "Heal amount: " + str(heal)):
+            return
         
         if verbose:
             print("{} kaytti kykya Heal hahmoon {}!".format(self.char.get_name(),target.get_name()))    
@@ -221,11 +218,8 @@ class RaiseDef(Skill):
         if coordinates not in all_squares:
             raise IllegalMoveException("Trying to use skill in no range!")
         
-        if not self.char.get_owner().is_ai():
-            string = "Raise stats for nearby allies?"
-            wnd = ConfirmSkill(self.char,self,string)
-            if not wnd.exec_():
-                return
+        if not self.char.get_game().confirm(self.char, self, "Raise stats for nearby allies?"):
+            return
         
         for square in all_squares:
             char = self.char.get_game().get_board().get_piece(square)
@@ -260,11 +254,8 @@ class RaiseRng(Skill):
         if coordinates not in all_squares:
             raise IllegalMoveException("Trying to use skill in no range!")
         
-        if not self.char.get_owner().is_ai():
-            string = "Raise range for nearby allies?"
-            wnd = ConfirmSkill(self.char,self,string)
-            if not wnd.exec_():
-                return
+        if not self.char.get_game().confirm(self.char, self, "Raise range for nearby allies?"):
+            return
         
         for square in all_squares:
             char = self.char.get_game().get_board().get_piece(square)
@@ -323,9 +314,9 @@ class Rest(Skill):
             if verbose:
                 print("{} kaytti kykya Rest!".format(self.char.get_name()))
             if self.char.get_hp() + self.gain <= self.char.get_maxhp(): # If character can heal whole amount
-                self.char.add_hp(self.gain)
+                self.char.add_hp(self.gain, verbose=verbose)
             else:   # If character can heal only a part of the self.gain
-                self.char.add_hp(self.char.get_maxhp() - self.char.get_hp())
+                self.char.add_hp(self.char.get_maxhp() - self.char.get_hp(), verbose=verbose)
         
         
 class Bodyguard(Skill):
@@ -445,11 +436,8 @@ class Wish(Skill):
         if SkillType.INSPIRED in skills:
             raise IllegalMoveException("Cannot use skill on chosen character!")     
         
-        if not self.char.get_owner().is_ai():
-            string = "Use Wish?"
-            wnd = ConfirmSkill(self.char,self,string)
-            if not wnd.exec_():
-                return 
+        if not self.char.get_game().confirm(self.char, self, "Use Wish?"):
+            return
         
         target.set_not_ready()
         target.add_skill(Inspired(target))
@@ -470,7 +458,7 @@ class Fortify(Skill):
         self.positive = True
         self.max_uses = 1
 
-    def new_turn(self):
+    def new_turn(self, verbose=True):
         self.increase_use_count(1)
 
     def get_stats(self, orig_stats):
@@ -490,7 +478,7 @@ class Swift(Skill):
         self.positive = True
         self.max_uses = 1
 
-    def new_turn(self):
+    def new_turn(self, verbose=True):
         self.increase_use_count(1)
 
     def get_stats(self, orig_stats):
@@ -509,7 +497,7 @@ class Inspired(Skill):
         self.positive = True
         self.max_uses = 1
 
-    def new_turn(self):
+    def new_turn(self, verbose=True):
         self.increase_use_count(1)
 
     def get_stats(self, orig_stats):
@@ -1,7 +1,31 @@
+# -*- coding: latin-1 -*-
+from collections import deque
+import math
+import os
+import pathlib
+import random
+import tempfile
+import time
 import unittest
+from unittest import mock
 
+from attack import CombatTable
+import configload
 import gameIO
+import mapgen
+import skill
+import ai.game_ai_4 as game_ai_4
+import ai.game_ai_5 as game_ai_5
+from ai.distance import DistanceMap
+from ai.search import SearchControl, SearchStats
+import ai.search as search
+from ai.threat import ThreatBoard
+from board import Board
+from game_enums import PlayerColor, SkillType, Terrain
 from game_errors import IllegalMoveException
+from move import Move
+from tile import terrain_tile
+import zobrist
 
 '''
 Testit eivt atm toimi, koska importit looppaa. Peli toimii kuitenkin.
@@ -16,11 +40,13 @@ class Test(unittest.TestCase):
     '''
     def setUp(self):
         unittest.TestCase.setUp(self)
+        check_positions = mock.patch.object(Board, 'CHECK_POSITIONS', True)   # Restored after the test
+        check_positions.start()
+        self.addCleanup(check_positions.stop)
         
         filename = "testsave.txt" # Should be in directory
         
-        self.io = gameIO.IO()
-        self.game = self.io.load_game(filename)
+        self.game = gameIO.load_game(filename)
         self.board = self.game.get_board()
         
         
@@ -85,6 +111,510 @@ class Test(unittest.TestCase):
         return check_this
             
 
+class TestDistances(unittest.TestCase):
+    '''
+    Tests the distance maps, eager, lazy and disk-cached, against a breadth-first search done directly over the
+    coordinates. The disk cache is kept in a temporary directory.
+    '''
+    def setUp(self):
+        unittest.TestCase.setUp(self)
+        self.cache_dir = tempfile.TemporaryDirectory()
+        getdir = configload.getdir
+        self.getdir = mock.patch.object(configload, 'getdir', lambda dirname: self.cache_dir.name if dirname == 'cache' else getdir(dirname))
+        self.getdir.start()
+
+    def tearDown(self):
+        self.getdir.stop()
+        self.cache_dir.cleanup()
+        unittest.TestCase.tearDown(self)
+
+    def reference_distances(self, board, start, skill_id):
+        '''
+        Returns a dictionary from each square to the number of steps to it from 'start' through passable squares,
+        or to the Manhattan distance if the square cannot be reached.
+        '''
+        found = {start: 0}
+        q = deque([start])
+        while q:
+            x, y = q.popleft()
+            for square in ((x,y+1), (x+1,y), (x,y-1), (x-1,y)):
+                if not (0 <= square[0] < board.width and 0 <= square[1] < board.height) or square in found:
+                    continue
+                passable = board.get_tile(square).passable
+                if passable == True or (passable != False and skill_id is not None and skill_id in passable):
+                    found[square] = found[(x,y)] + 1
+                    q.append(square)
+        return { (x,y): found.get((x,y), abs(start[0]-x) + abs(start[1]-y)) for y in range(board.height) for x in range(board.width) }
+
+    def check(self, distmap, board):
+        squares = [ (x,y) for y in range(board.height) for x in range(board.width) ]
+        for sk in [None] + skill.Skill.movement_skills:
+            for start in squares:
+                expected = self.reference_distances(board, start, sk)
+                found = { end: distmap.get_distance_with_skill(start, end, sk) for end in squares }
+                self.assertEqual(found, expected, "The distances from " + str(start) + " differ from the breadth-first search")
+
+    def test_same_distances(self):
+        for filename in ("testsave.txt", configload.get_filepath('savedata', 'save_yaml.yaml')):
+            board = gameIO.load_game(filename).get_board()
+            self.check(DistanceMap(board, lazy=False, disk_cache=False), board)
+            self.check(DistanceMap(board, lazy=True, disk_cache=False), board)
+            self.check(DistanceMap(board, lazy=True, cache_size_mb=0.001, disk_cache=False), board)   # Rows are evicted from the cache
+            self.check(DistanceMap(board, lazy=False, disk_cache=True), board)     # Calculated and written to the cache
+            cached = DistanceMap(board, lazy=False, disk_cache=True)               # Read from the cache
+            self.assertTrue(cached.cache_files, "The distances were not stored in the disk cache")
+            self.check(cached, board)
+
+    def test_disk_cache_eviction(self):
+        first  = gameIO.load_game("testsave.txt").get_board()
+        second = gameIO.load_game(configload.get_filepath('savedata', 'save_yaml.yaml')).get_board()
+        first_files = set(DistanceMap(first, lazy=False, disk_cache=True, disk_cache_size_mb=0).cache_files.values())
+        second_map = DistanceMap(second, lazy=False, disk_cache=True, disk_cache_size_mb=0)
+        files = set(str(path) for path in pathlib.Path(self.cache_dir.name).glob('*.dist'))
+        self.assertEqual(files, set(second_map.cache_files.values()), "The least recently used files were not removed")
+        self.assertFalse(files & first_files)
+        self.check(second_map, second)
+
+    def test_lazy_without_disk_cache(self):
+        board = gameIO.load_game("testsave.txt").get_board()
+        distmap = DistanceMap(board, lazy=True, disk_cache=True)
+        self.assertTrue(distmap.lazy)
+        self.assertFalse(distmap.cache_files)
+
+def random_move(game, rng):
+    '''
+    Returns a random move (moving, attacking or using a skill) of a character of the player whose turn it is.
+    The turn is changed first if the player is ready.
+    '''
+    if game.is_player_ready():
+        game.change_turn(verbose=False)
+    char = rng.choice([ char for char in game.get_current_player().get_characters() if not char.is_ready() ])
+    square = rng.choice(char.get_legal_squares())
+    moves = [ Move(char.get_square(), square, None, 'p', None) ]
+    for attack in char.get_attacks():
+        for target in char.define_attack_targets(square, attack.get_range()[1], True):
+            moves.append(Move(char.get_square(), square, target, 'a', attack.type))
+    for sk in char.skills:
+        if sk.range:
+            for target in char.define_attack_targets(square, sk.range, sk.target_enemy):
+                moves.append(Move(char.get_square(), square, target, 's', sk.type))
+    return rng.choice(moves)
+
+
+def game_state(game):
+    '''
+    Returns the state of the game which make_move changes, in a form that can be compared.
+    '''
+    chars = game.get_blue_player().get_characters() + game.get_red_player().get_characters()
+    return (game.whose_turn, game.turn_number, game.get_hash(),
+            [ (list(player.get_characters()), player.alive, player.won, player.lost, player.first, player.vip) for player in game.players.values() ],
+            dict(game.board.positions),
+            [ (char.get_square(), char.hp, char.alive, char.ready, char.init_square, dict(char.stats), char.status, char.carried, char.carrying,
+               [ (sk.type, sk.use_count, sk.has_ended) for sk in char.skills ]) for char in chars ])
+
+
+class TestUndo(unittest.TestCase):
+    '''
+    Tests that unmake_move returns the game to the state it was in before make_move.
+    '''
+    def test_make_unmake(self):
+        rng = random.Random(3)
+        game = gameIO.load_game(configload.get_filepath('savedata', 'save_yaml.yaml'))
+        for player in game.players.values():
+            player.ai = True
+            for char in player.get_characters():
+                char.hp = 4     # So that characters die, too
+        game.get_board().refresh_hash()
+
+        for _ in range(200):
+            move = random_move(game, rng)
+            before = game_state(game)
+            try:
+                undo = game.make_move(move)
+            except IllegalMoveException:
+                self.assertEqual(game_state(game), before, "A failed move changed the game")
+                continue
+            game.unmake_move(undo)
+            self.assertEqual(game_state(game), before, "The game differs after unmake_move")
+            game.get_board().check_positions()
+            game.apply_move(move, verbose=False)
+            if game.is_game_over():
+                break
+
+    def test_restore_flags(self):
+        game = gameIO.load_game(configload.get_filepath('savedata', 'save_yaml.yaml'))
+        before = game_state(game)
+        snapshot = game.snapshot()
+        for player in game.players.values():
+            player.first = not player.first
+            player.vip = not player.vip
+            for char in player.get_characters():
+                char.set_status('test')
+        game.restore(snapshot)
+        self.assertEqual(game_state(game), before, "The players' flags or the characters' statuses were not restored")
+
+
+class TestHash(unittest.TestCase):
+    '''
+    Tests that the incrementally updated Zobrist hash equals the hash calculated from scratch.
+    '''
+    def full_hash(self, board):
+        hash = 0
+        for object, square in board.positions.items():
+            hash ^= zobrist.object_hash(object, square)
+        return hash
+
+    def test_incremental_hash(self):
+        rng = random.Random(5)
+        game = gameIO.load_game(configload.get_filepath('savedata', 'save_yaml.yaml'))
+        for player in game.players.values():
+            player.ai = True
+        board = game.get_board()
+        for _ in range(200):
+            self.assertEqual(board.get_hash(), self.full_hash(board), "The hash was not updated correctly")
+            try:
+                game.apply_move(random_move(game, rng), verbose=False)
+            except IllegalMoveException:
+                continue
+            if game.is_game_over():
+                break
+        self.assertEqual(board.get_hash(), self.full_hash(board), "The hash was not updated correctly")
+
+    def test_map_in_hash(self):
+        first  = gameIO.load_game("benchmarks/maps/small.yaml")
+        second = gameIO.load_game("benchmarks/maps/small.yaml")
+        self.assertEqual(first.get_hash(), second.get_hash())
+        square = (0, 0)
+        terrain = Terrain.WALL if first.get_board().get_terrain(square).get_terrain() != Terrain.WALL else Terrain.PLAIN
+        second.get_board().set_tile(terrain_tile(terrain), square)
+        self.assertNotEqual(first.get_hash(), second.get_hash(), "The terrain does not change the hash of the game")
+
+
+class TestCombatTable(unittest.TestCase):
+    '''
+    Tests that the cached combat values equal the ones calculated directly with the attacks.
+    '''
+    def check(self, table, game):
+        blue = game.get_blue_player().get_characters()
+        red  = game.get_red_player().get_characters()
+        for attackers, targets in ((blue, red), (red, blue)):
+            for char in attackers:
+                for attack in char.get_attacks():
+                    for target in targets:
+                        expected = (attack.calculate_max_damage(target), attack.calculate_accuracy(target), attack.calculate_probable_damage(target))
+                        self.assertEqual(table.get(attack, target), expected)
+                        self.assertEqual(table.max_damage(attack, target), expected[0])
+                        self.assertEqual(table.accuracy(attack, target), expected[1])
+
+    def test_same_values(self):
+        rng = random.Random(7)
+        game = gameIO.load_game(configload.get_filepath('savedata', 'save_yaml.yaml'))
+        for player in game.players.values():
+            player.ai = True
+        table = CombatTable()
+        # The table is kept over the moves, as the AI keeps it over a turn: the values must follow the changes
+        # of the characters' squares, HP and stats
+        for _ in range(60):
+            self.check(table, game)
+            try:
+                game.apply_move(random_move(game, rng), verbose=False)
+            except IllegalMoveException:
+                continue
+            if game.is_game_over():
+                break
+        self.check(table, game)
+
+
+class TestThreatBoard(unittest.TestCase):
+    '''
+    Tests that the ThreatBoard equals a threat map built square by square in plain Python.
+    '''
+    def threat_map(self, board, player):
+        '''
+        Returns a dictionary from each square to the set of (square of the attacking character, attack type) which
+        can reach it this turn.
+        '''
+        threats = {}
+        for char in player.get_characters():
+            for square in char.get_legal_squares():
+                for attack in char.get_attacks():
+                    for target in board.get_tiles_in_range(square, attack.get_range()[1]):
+                        threats.setdefault(tuple(target), set()).add((tuple(char.get_square()), attack.type))
+        return threats
+
+    def check(self, game):
+        board = game.get_board()
+        for player in game.players.values():
+            threat_board = ThreatBoard(board, player)
+            threats = self.threat_map(board, player)
+            attackable = threat_board.attackable_squares()
+            for y in range(board.height):
+                for x in range(board.width):
+                    attacks = [ (tuple(square), attack_type) for square, attack_type in threat_board.attacks_at((x,y)) ]
+                    self.assertEqual(len(attacks), len(set(attacks)), "An attack is listed twice")
+                    self.assertEqual(set(attacks), threats.get((x,y), set()))
+                    self.assertEqual(bool(attackable[y, x]), (x,y) in threats)
+
+    def test_same_threats(self):
+        rng = random.Random(11)
+        for filename in ("testsave.txt", configload.get_filepath('savedata', 'save_yaml.yaml')):
+            game = gameIO.load_game(filename)
+            for player in game.players.values():
+                player.ai = True
+            for _ in range(20):
+                self.check(game)
+                try:
+                    game.apply_move(random_move(game, rng), verbose=False)
+                except IllegalMoveException:
+                    continue
+                if game.is_game_over():
+                    break
+
+
+class TestSeed(unittest.TestCase):
+    '''
+    Tests that the same seed replays the same game, also when the games are played in the same process.
+    '''
+    def play(self, ai_func, seed, moves):
+        game = gameIO.load_game("benchmarks/maps/small.yaml")
+        game.set_seed(seed)
+        game_ai_4.reset_caches()
+        for color in (PlayerColor.BLUE, PlayerColor.RED):
+            game.get_player(color).ai = True
+            game.get_player(color).ai_func = ai_func
+        played = []
+        while len(played) < moves and not game.is_game_over():
+            if game.is_player_ready():
+                game.change_turn(verbose=False)
+                continue
+            move = game.ai_get_move()
+            played.append((move.source_square, move.destination_square, move.target_square, move.action_type, move.action_id))
+            game.apply_move(move, verbose=False)
+        return played
+
+    def test_same_seed_twice(self):
+        for ai_func in (game_ai_4.get_move, game_ai_5.get_move):
+            first  = self.play(ai_func, 5, 20)
+            second = self.play(ai_func, 5, 20)
+            self.assertEqual(first, second, "The same seed gave a different game the second time")
+
+    def test_new_game_keeps_caches(self):
+        game_ai_4.combat_table.entries['key'] = (1, 100, 1.0)
+        self.addCleanup(game_ai_4.reset_caches)
+        gameIO.load_game("benchmarks/maps/small.yaml").set_seed(5)
+        self.assertIn('key', game_ai_4.combat_table.entries, "Loading a game emptied the caches of the running match")
+
+
+class TestMapgen(unittest.TestCase):
+    '''
+    Tests that the generated maps can be loaded and that no two characters start in the same square.
+    '''
+    def load(self, text):
+        file = tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False)
+        try:
+            file.write(text)
+            file.close()
+            return gameIO.load_game(file.name)
+        finally:
+            os.unlink(file.name)
+
+    def test_generated_maps_load(self):
+        for width, height, seed, units in ((4, 4, 1, 8), (5, 3, 2, 7), (16, 12, 3, 10), (32, 32, 1, 10)):
+            game = self.load(mapgen.generate(width, height, seed=seed, units=units))
+            chars = game.get_blue_player().get_characters() + game.get_red_player().get_characters()
+            self.assertEqual(len(chars), 2*units, "A character is missing from the generated map")
+            squares = [tuple(char.get_square()) for char in chars]
+            self.assertEqual(len(set(squares)), len(squares), "Two characters start in the same square")
+
+    def test_too_many_units(self):
+        self.assertRaises(ValueError, mapgen.generate, 4, 4, 1, 9)
+
+
+class TestReachability(unittest.TestCase):
+    '''
+    Tests that the cached legal squares equal the ones calculated directly after the board or a character changes.
+    '''
+    def check(self, board, chars):
+        for char in chars:
+            if char.alive:
+                square = char.get_square()
+                self.assertEqual(board.cached_legal_squares_from_tile(char, square), board.legal_squares_from_tile(char, square),
+                                 "The cached legal squares of " + char.get_name() + " are out of date")
+
+    def test_cache_invalidation(self):
+        game = gameIO.load_game(configload.get_filepath('savedata', 'save_yaml.yaml'))
+        board = game.get_board()
+        chars = game.get_blue_player().get_characters() + game.get_red_player().get_characters()
+        self.check(board, chars)
+
+        # A character moves
+        char = chars[0]
+        destination = [ square for square in char.get_legal_squares() if square != char.get_square() ][-1]
+        board.move_char(char.get_square(), destination, verbose=False)
+        self.check(board, chars)
+
+        # A character dies
+        chars[-1].set_hp(0, verbose=False)
+        self.check(board, chars)
+
+        # A character gets a movement skill, then more range, and loses the movement skill again
+        for char in chars[:3]:
+            char.add_skill(skill.Ghost(char))
+            self.check(board, chars)
+            char.add_skill(skill.Swift(char))
+            self.check(board, chars)
+            char.delete_skill(SkillType.GHOST)
+            self.check(board, chars)
+
+
+class TestStatsCache(unittest.TestCase):
+    '''
+    Tests that the cached stats of the characters equal the stats calculated again after the skills change.
+    '''
+    def check(self, chars):
+        for char in chars:
+            cached = dict(char.get_stats())
+            char.invalidate_stats()
+            self.assertEqual(cached, dict(char.get_stats()), "The cached stats of " + char.get_name() + " are out of date")
+
+    def test_cache_invalidation(self):
+        game = gameIO.load_game(configload.get_filepath('savedata', 'save_yaml.yaml'))
+        chars = game.get_blue_player().get_characters() + game.get_red_player().get_characters()
+        self.check(chars)
+
+        # A skill is added, and expires
+        char = chars[0]
+        swift = skill.Swift(char)
+        char.add_skill(swift)
+        self.check(chars)
+        swift.increase_use_count(1)
+        self.check(chars)
+        self.assertNotIn(SkillType.SWIFT, char.get_skills())
+
+        # A skill which gives other skills is used, and the move is unmade
+        cleric = [ char for char in game.get_current_player().get_characters() if SkillType.RAISERNG in char.get_skills() ][0]
+        square = cleric.get_square()
+        before = { char: dict(char.get_stats()) for char in chars }
+        undo = game.make_move(Move(square, square, square, 's', SkillType.RAISERNG))
+        self.check(chars)
+        self.assertIn(SkillType.SWIFT, cleric.get_skills())
+        game.unmake_move(undo)
+        self.check(chars)
+        self.assertEqual({ char: dict(char.get_stats()) for char in chars }, before)
+
+
+class TestWorkers(unittest.TestCase):
+    '''
+    Tests that game_ai_4 chooses the same moves when the candidates are evaluated in a process pool.
+    '''
+    def tearDown(self):
+        for pool in game_ai_4.worker_pools.values():
+            pool.shutdown()
+        game_ai_4.worker_pools.clear()
+        unittest.TestCase.tearDown(self)
+
+    def test_same_moves(self):
+        games = { workers: gameIO.load_game("benchmarks/maps/small.yaml") for workers in (1, 3) }
+        for game in games.values():
+            game.set_seed(3)
+        for seed in range(8):
+            moves = {}
+            for workers, game in games.items():
+                if game.is_player_ready():
+                    game.change_turn(verbose=False)
+                move = game_ai_4.get_move(game, game.whose_turn, workers=workers, seed=seed)
+                moves[workers] = (move.source_square, move.destination_square, move.target_square, move.action_type, move.action_id)
+                game.apply_move(move, verbose=False)
+            self.assertEqual(moves[1], moves[3], "The process pool chose a different move")
+
+
+class TestSearch(unittest.TestCase):
+    '''
+    Tests that the alpha-beta search of game_ai_5 finds the same value and move as a search without pruning.
+    '''
+    def minimax(self, game, depth, beam_width, seed):
+        '''
+        Searches every line like game_ai_5.search, but without alpha-beta pruning or the transposition table.
+        '''
+        player_color = game.whose_turn
+        char = game_ai_5.next_character(game, player_color)
+        enemy_color = PlayerColor.BLUE if player_color == PlayerColor.RED else PlayerColor.RED
+        player_threat_board = game_ai_4.construct_player_threat_board(game, game.get_player(player_color))
+        enemy_threat_board  = game_ai_4.construct_player_threat_board(game, game.get_player(enemy_color))
+        candidates = list(enumerate(game_ai_4.get_candidate_moves(game, char)))
+        for index, value, target_square in game_ai_4.evaluate_candidates(game, char, candidates, player_color, player_threat_board, enemy_threat_board, f"{seed}:{game.get_hash()}"):
+            candidates[index][1].value, candidates[index][1].target_square = value, target_square
+        moves = sorted([move for index, move in candidates], key=lambda move: -move.value.get())
+        if depth <= 1:
+            return moves[0].value.get(), game_ai_5.move_key(moves[0])
+
+        best_value, best_key = -math.inf, None
+        for move in moves[:beam_width]:
+            value = move.value.get()
+            if not math.isinf(value):
+                random_state = game.rng.getstate()
+                game.rng.seed(f"{seed}:{game.get_hash()}:{game_ai_5.move_key(move)}")
+                undo = game.make_move(move, verbose=False)
+                if not game.is_game_over():
+                    if game.is_player_ready():
+                        game.change_turn(verbose=False)
+                    value = self.minimax(game, depth-1, beam_width, seed)[0]
+                    if game.whose_turn != player_color:
+                        value = -value
+                game.unmake_move(undo)
+                game.rng.setstate(random_state)
+            if best_key is None or value > best_value:
+                best_value, best_key = value, game_ai_5.move_key(move)
+        return best_value, best_key
+
+    def test_same_result_without_pruning(self):
+        game = gameIO.load_game("benchmarks/maps/small.yaml")
+        game.set_seed(2)
+        for player in game.players.values():
+            player.ai = True
+        stats = SearchStats()
+        for _ in range(6):
+            if game.is_player_ready():
+                game.change_turn(verbose=False)
+            for depth, beam_width in ((2, None), (4, 3)):
+                game_ai_4.reset_caches()
+                value, move = game_ai_5.search(game, depth, -math.inf, math.inf, beam_width, stats, seed=7, root=True)
+                self.assertEqual((value, game_ai_5.move_key(move)), self.minimax(game, depth, beam_width, 7),
+                                 f"Pruning changed the result of a search of depth {depth}")
+            game.apply_move(game_ai_4.get_move(game, game.whose_turn), verbose=False)
+        self.assertGreater(stats.cutoffs, 0, "The searches were not pruned")
+
+
+class TestBudget(unittest.TestCase):
+    '''
+    Tests that the anytime driver returns within its time budget and leaves the game as it was.
+    '''
+    def test_budget(self):
+        game = gameIO.load_game(configload.get_filepath('savedata', 'save_yaml.yaml'))
+        game.set_seed(1)
+        game.get_player(game.whose_turn).ai_func = search.make_ai_func(game_ai_5.get_move, 0.3)
+        for player in game.players.values():
+            for char in player.get_characters():
+                char.get_legal_squares()    # Sets init_square, as any search does
+        before, hash_before = game_state(game), game.get_hash()
+        stats = SearchStats()
+        start = time.perf_counter()
+        move = search.iterative_deepening(game, game.whose_turn, game_ai_5.get_move, 0.3, stats=stats)
+        self.assertLess(time.perf_counter() - start, 0.8, "The search did not stop when its time ran out")
+        self.assertIsNotNone(move)
+        self.assertGreaterEqual(stats.depth, 1)
+        self.assertLess(stats.depth, 20, "The search was not stopped in the middle")
+        self.assertEqual(game.get_hash(), hash_before, "The stopped search changed the game")
+        self.assertEqual(game_state(game), before, "The stopped search changed the game")
+
+        # The function made by make_ai_func gets the control of the caller, and can be cancelled with it
+        control = SearchControl()
+        control.cancel()
+        move = game.ai_get_move(control)
+        self.assertEqual((move.source_square, move.action_type), (move.destination_square, 'p'))
+        self.assertEqual(game_state(game), before)
+
+
 if __name__ == '__main__':
     unittest.main()
     
\ No newline at end of file
@@ -1,61 +1,69 @@
 '''
 Classes represent the environment where characters ale moving. Each of them has
 different properties.
+
+The tiles are flyweights: there is only one shared, read-only Tile object per terrain (see terrain_tile).
+The board stores the terrain of each square as a terrain id (see TERRAIN_IDS) and the objects on the squares
+separately, and Board.get_tile returns a TileView combining the two for a single square.
 '''
+from types import MappingProxyType
 
-from game_errors import IllegalMoveException
 from skill import Skill
 from game_enums import Stats
-from PyQt5.QtGui import QColor
 from game_enums import Terrain, SkillType
 
 
+# Terrain -> (color of the tile, color when a character can move to the tile) as (r,g,b); the GUI converts them
+TERRAIN_COLORS = {
+    Terrain.PLAIN       : ((243,243,215), (170,170,255)),
+    Terrain.SAND        : ((255,237,135), (129,179,254)),
+    Terrain.WALL        : ((0,0,0),       (170,170,255)),
+    Terrain.FOREST      : ((17,197,8),    (6,198,155)),
+    Terrain.MOUNTAIN    : ((172,172,172), (174,155,234)),
+    Terrain.WATER       : ((0,13,255),    (152,3,252)),
+    Terrain.SNOW        : ((249,249,249), (239,209,239)),
+    Terrain.WOOD        : ((120,74,50),   (207,105,167)),
+    Terrain.GOAL        : ((255,210,74),  (152,3,252)),
+}
+DEFAULT_COLORS  = ((255,255,255), (170,170,255))
+COLOR_ATTACK    = (254,72,52)   # Color to indicate that a character can attack to a tile
+COLOR_SKILL     = (135,241,95)  # Color to indicate that a character can use a skill on a tile
+
+
 class Tile:
     '''
     Basic class for all tiles.
     '''
     
-    def __init__(self,game):
-        self.game = game
-        self.object = None      # Initially holds no object
+    def __init__(self):
         self.passable = True    # List of skills char has to have to pass; True if always passable, False if never passable
         self.endable = True     # List of skills char has to have to end on this tile; True if endable regardless of skills, False if never endable
         self.steps_taken = 1    # Basic amount steps needed to pass; can be altered by char skills
         self.terrain = None
         self.combat = {Stats.ATTACK: 0, Stats.DEFENSE: 0, Stats.MAGIC: 0, Stats.RESISTANCE: 0, Stats.SPEED: 0, Stats.EVASION: 0}
         self.set_combat()
-        self.color = QColor(255,255,255) # Color for this type of tile; used by GUI
-        self.color2 = QColor(170,170,255)
-        self.color_attack = QColor(254,72,52) # Color to indicate that a character can attack to this tile
-        self.color_skill = QColor(135,241,95)
-        self.gui_tile = None    # Makes a connection between this tile and its counterpart in gui
-     
-    def get_object(self):
-        return self.object
+
+    def __reduce__(self):
+        '''
+        Copies and pickles of the game keep using the shared tile of the terrain.
+        '''
+        return (terrain_tile, (self.terrain,))
     
     def get_terrain(self):
         return self.terrain
     
     def get_color(self):
-        return self.color
+        return TERRAIN_COLORS.get(self.terrain, DEFAULT_COLORS)[0]
     
     def get_color2(self):
-        return self.color2
+        return TERRAIN_COLORS.get(self.terrain, DEFAULT_COLORS)[1]
     
     def get_color_attack(self):
-        return self.color_attack
+        return COLOR_ATTACK
     
     def get_color_skill(self):
-        return self.color_skill
+        return COLOR_SKILL
     
-    def set_object(self, object):
-        if self.object != None:
-            raise IllegalMoveException("Tile is already occupied!")
-        self.object = object
-        
-    def remove_object(self):
-        self.object = None
-        
     def set_combat(self):
         '''
         Tells how much terrain affects when in combat.
@@ -85,61 +93,67 @@ class Tile:
     def get_endable(self):
         return self.endable
     
-    def pass_by(self,char,steps):
+    def get_movement_rule(self, char):
+        '''
+        Defines how a character can move on this tile, regardless of what is currently on it.
+        The rule depends only on the tile and on the character's skills, so it can be reused while the skills stay the same.
+        @param char: Which character we are moving
+        @return: Tuple (can_pass, can_end, steps_taken). Can_pass tells if the character can get on this tile at all,
+        can_end if it can end its movement on this tile when the tile is empty, and steps_taken how many steps
+        the character needs to pass this tile.
+        '''
+        skills = char.get_skills()
+        if self.passable == True or self.passable == False:
+            can_pass = self.passable
+        else:
+            can_pass = any([skill in self.passable for skill in skills])
+        if self.endable == True or self.endable == False:
+            can_end = self.endable
+        else:
+            can_end = any([skill in self.endable for skill in skills])
+        steps_taken = -self.define_steps_left(char, 0)
+        return (can_pass, can_end, steps_taken)
+    
+    def pass_by(self,char,steps,rule=None,skills=None,object=None):
         '''
         Defines if a character can pass through this tile and/or end on this tile.
-        Assistant method of Board.pass_by_square().
+        Assistant method of Board.legal_squares_from_tile().
         @param char: Which character we are moving
         @param steps: How many steps char can still take. Used to define return value steps_left
+        @param rule: The character's movement rule on this tile, from get_movement_rule (optional)
+        @param skills: The character's skills, from char.get_skills() (optional)
+        @param object: The object on the square, or None if it is empty
         @return: Tuple result: (add, steps_left). Add tells if the character can actually end on this tile, 
         steps_left tells how many steps the character can take after this tile.
         If character can't actually get on this tile (Wall, for example), return value is always (False, 0).
         If character can pass by this tile but can not end on it, return value is (False, steps_left).
         '''
-        add = False
-        steps_left = 0
-        skills = char.get_skills()
-        
+        if rule is None:
+            rule = self.get_movement_rule(char)
+        can_pass, can_end, steps_taken = rule
         
         # Defines if the character can actually be on this tile
-        if self.passable != True:
-            if self.passable == False:
-                return(add, steps_left)
-            can_pass = False
-            skills_passable = self.passable
-            for skill in skills:
-                if skill in skills_passable:
-                    can_pass = True
-            if not can_pass:
-                return (add, steps_left)
-        
+        if not can_pass:
+            return (False, 0)
         
         # Tile is empty
-        if self.object == None:
-            if self.endable == True:
-                add = True
-            elif self.endable == False:
-                add = False
-            else:
-                for skill in skills:
-                    if skill in self.endable:
-                        add = True
-            steps_left = self.define_steps_left(char, steps)
-            return (add, steps_left)
+        if object == None:
+            return (can_end, steps - steps_taken)
         
         # Tile has an ally on it
-        elif not self.object.is_enemy(char) and steps - self.steps_taken > 0:
-            steps_left = self.define_steps_left(char, steps)
-            return (add, steps_left)
+        if not object.is_enemy(char):
+            if steps - self.steps_taken > 0:
+                return (False, steps - steps_taken)
         
         # Tile has an enemy on it
         elif steps - self.steps_taken > 0:
+            if skills is None:
+                skills = char.get_skills()
             for skill in skills:
                 if skill in Skill.can_pass_enemies:
-                    steps_left = self.define_steps_left(char, steps)
-                    return (add, steps_left)
+                    return (False, steps - steps_taken)
                 
-        return (add, steps_left)
+        return (False, 0)
         
     def define_steps_left(self,char,steps):
         '''
@@ -162,14 +176,12 @@ class Plain(Tile):
     Every character can end on this tile.
     '''
             
-    def __init__(self,game):
-        Tile.__init__(self,game)
-        self.object = None
+    def __init__(self):
+        Tile.__init__(self)
         self.passable = True
         self.endable = True
         self.steps_taken = 1
         self.terrain = Terrain.PLAIN
-        self.color = QColor(243,243,215)
     
     def define_steps_left(self,char,steps):
         return steps - self.steps_taken     # 1 for every character class; always passable
@@ -184,15 +196,12 @@ class Sand(Tile):
     Also reduces speed in combat.
     '''
     
-    def __init__(self,game):
-        Tile.__init__(self,game)
-        self.object = None
+    def __init__(self):
+        Tile.__init__(self)
         self.passable = True
         self.endable = True
         self.steps_taken = 2
         self.terrain = Terrain.SAND
-        self.color = QColor(255,237,135)
-        self.color2 = QColor(129,179,254)
         
     def define_steps_left(self,char,steps):
         '''
@@ -217,14 +226,12 @@ class Wall(Tile):
     Unpassable for normal characters.
     '''
     
-    def __init__(self,game):
-        Tile.__init__(self,game)
-        self.object = None
+    def __init__(self):
+        Tile.__init__(self)
         self.passable = [SkillType.GHOST]
         self.endable = False
         self.steps_taken = 1
         self.terrain = Terrain.WALL
-        self.color = QColor(0,0,0)
         
     def define_steps_left(self,char,steps):
         '''
@@ -243,15 +250,12 @@ class Forest(Tile):
     Tile halts characters by 0.5.
     Additionally reduces speed in combat for those without certain skills.
     '''
-    def __init__(self,game):
-        Tile.__init__(self,game)
-        self.object = None
+    def __init__(self):
+        Tile.__init__(self)
         self.passable = True
         self.endable = True
         self.steps_taken = 1.5
         self.terrain = Terrain.FOREST
-        self.color = QColor(17,197,8)
-        self.color2 = QColor(6,198,155)
         
     def define_steps_left(self,char,steps):
         steps_taken = self.steps_taken
@@ -273,15 +277,12 @@ class Mountain(Tile):
     Halts movement for characters with horses. 
     '''
     
-    def __init__(self,game):
-        Tile.__init__(self,game)
-        self.object = None
+    def __init__(self):
+        Tile.__init__(self)
         self.passable = True
         self.endable = True
         self.steps_taken = 1
         self.terrain = Terrain.MOUNTAIN
-        self.color = QColor(172,172,172)
-        self.color2 = QColor(174,155,234)
         
     def define_steps_left(self,char,steps):
         steps_taken = self.steps_taken
@@ -301,15 +302,12 @@ class Water(Tile):
     '''
     Normally unpassable, but some characters can fly over.
     '''
-    def __init__(self,game):
-        Tile.__init__(self,game)
-        self.object = None
+    def __init__(self):
+        Tile.__init__(self)
         self.passable = [SkillType.LEVITATE]
         self.endable = [SkillType.LEVITATE]
         self.steps_taken = 1
         self.terrain = Terrain.WATER
-        self.color = QColor(0,13,255)
-        self.color2 = QColor(152,3,252)
         
     def define_steps_left(self,char,steps):
         '''
@@ -325,15 +323,12 @@ class Snow(Tile):
     '''
     Identical to Forest except for the colour.
     '''
-    def __init__(self,game):
-        Tile.__init__(self,game)
-        self.object = None
+    def __init__(self):
+        Tile.__init__(self)
         self.passable = True
         self.endable = True
         self.steps_taken = 1.5
         self.terrain = Terrain.SNOW
-        self.color = QColor(249,249,249)
-        self.color2 = QColor(239,209,239)
         
     def define_steps_left(self,char,steps):
         steps_taken = self.steps_taken
@@ -356,15 +351,12 @@ class Wood(Tile):
     Identical to Plain except for the colour.
     '''
             
-    def __init__(self,game):
-        Tile.__init__(self,game)
-        self.object = None
+    def __init__(self):
+        Tile.__init__(self)
         self.passable = True
         self.endable = True
         self.steps_taken = 1
         self.terrain = Terrain.WOOD
-        self.color = QColor(120,74,50)
-        self.color2 = QColor(207,105,167)
     
     def define_steps_left(self,char,steps):
         return steps - self.steps_taken     # 1 for every character class; always passable
@@ -378,15 +370,12 @@ class Goal(Tile):
     '''
     Objective of the map.
     '''
-    def __init__(self,game):
-        Tile.__init__(self,game)
-        self.object = None
+    def __init__(self):
+        Tile.__init__(self)
         self.passable = True
         self.endable = True
         self.steps_taken = 1
         self.terrain = Terrain.GOAL
-        self.color = QColor(255,210,74)
-        self.color2 = QColor(152,3,252)
         
         
     def define_steps_left(self,char,steps):
@@ -398,4 +387,83 @@ class Goal(Tile):
     def set_combat(self):
         self.combat[Stats.DEFENSE] -= 3
         self.combat[Stats.RESISTANCE] -= 3
-        self.combat[Stats.EVASION] -= 10
\ No newline at end of file
+        self.combat[Stats.EVASION] -= 10
+
+
+TERRAIN_TO_TILE = {
+    Terrain.PLAIN:      Plain,
+    Terrain.SAND:       Sand,
+    Terrain.WALL:       Wall,
+    Terrain.FOREST:     Forest,
+    Terrain.MOUNTAIN:   Mountain,
+    Terrain.WATER:      Water,
+    Terrain.SNOW:       Snow,
+    Terrain.WOOD:       Wood,
+    Terrain.GOAL:       Goal,
+}
+
+# Terrain id -> Terrain; the board stores the terrain of each square as its id (index in this list)
+TERRAIN_IDS = list(TERRAIN_TO_TILE)
+TERRAIN_TO_ID = { terrain: i for i, terrain in enumerate(TERRAIN_IDS) }
+
+tiles = {}  # Terrain -> its shared Tile, created on first use
+
+
+def terrain_tile(terrain):
+    '''
+    Returns the shared Tile of the terrain. Its attributes must not be changed, as all squares of the terrain
+    on all boards use the same object; the combat bonuses are a read-only mapping.
+    @param terrain: Terrain value, e.g. Terrain.FOREST
+    '''
+    tile = tiles.get(terrain)
+    if tile is None:
+        tile = TERRAIN_TO_TILE[terrain]()
+        tile.combat = MappingProxyType(tile.combat)
+        tiles[terrain] = tile
+    return tile
+
+
+def terrain_id(terrain):
+    '''
+    Returns the id of the terrain, as stored by the board.
+    '''
+    return TERRAIN_TO_ID[terrain]
+
+
+class TileView:
+    '''
+    Lightweight view of one square of the board: the shared Tile of its terrain together with the object on it.
+    Returned by Board.get_tile; it reads the board, so it always shows the square's current contents.
+    '''
+    __slots__ = ('board', 'square_id')
+
+    def __init__(self, board, square_id):
+        self.board      = board
+        self.square_id  = square_id
+
+    def get_tile(self):
+        '''
+        Returns the shared Tile of the square's terrain.
+        '''
+        return TERRAIN_TILES[self.board.terrain_grid[self.square_id]]
+
+    def get_object(self):
+        return self.board.occupants[self.square_id]
+
+    def pass_by(self, char, steps, rule=None, skills=None):
+        return self.get_tile().pass_by(char, steps, rule, skills, self.get_object())
+
+    def __getattr__(self, name):
+        # Everything else (terrain, colors, combat bonuses, movement rules) comes from the terrain
+        if name in TileView.__slots__:
+            raise AttributeError(name)
+        return getattr(self.get_tile(), name)
+
+    def __eq__(self, other):
+        return isinstance(other, TileView) and self.board is other.board and self.square_id == other.square_id
+
+    def __hash__(self):
+        return hash((id(self.board), self.square_id))
+
+
+TERRAIN_TILES = [ terrain_tile(terrain) for terrain in TERRAIN_IDS ]  # Terrain id -> its shared Tile
@@ -0,0 +1,200 @@
+'''
+Tournament between AI modules: every AI plays every other AI on every given map, on both sides, in a process pool.
+The results of the games are appended to a JSON lines file as they finish, so an interrupted tournament can be
+continued by running the same command again. Each game has its own seed derived from the tournament seed and
+the game's description, so a game gives the same result whenever and in whichever process it is played.
+Run from the src directory, e.g. with
+    python -m tournament results.jsonl --ai game_ai_1 game_ai_3 game_ai_4 --games 4 --workers 4
+'''
+import argparse
+import concurrent.futures
+import json
+import os
+import random
+import traceback
+
+import configload
+import simulate
+from game_enums import PlayerColor
+
+
+ELO_START   = 1500
+ELO_K       = 32
+
+
+def schedule(ais, filenames, games, seed=0):
+    '''
+    Returns a list of the games of a tournament, each a dictionary with keys 'id', 'blue', 'red', 'save', 'round'
+    and 'seed'. Every pair of different AIs plays 'games' games on each map with both colors.
+    '''
+    scheduled = []
+    for round in range(games):
+        for filename in filenames:
+            for blue in ais:
+                for red in ais:
+                    if blue == red:
+                        continue
+                    id = f"{blue}|{red}|{os.path.basename(filename)}|{round}"
+                    scheduled.append({
+                        'id'    : id,
+                        'blue'  : blue,
+                        'red'   : red,
+                        'save'  : filename,
+                        'round' : round,
+                        'seed'  : random.Random(f"{seed}:{id}").getrandbits(32),
+                    })
+    return scheduled
+
+
+def play(scheduled_game, max_turns=simulate.DEFAULT_MAX_TURNS, budget=None):
+    '''
+    Plays a scheduled game and returns its result as a dictionary which can be written as JSON. Run in the worker processes.
+    @param budget: Time budget per move in seconds, or None for no limit (see simulate.play_game)
+    An exception raised by an AI is recorded in the key 'error' instead of stopping the tournament.
+    '''
+    record = dict(scheduled_game)
+    try:
+        result = simulate.play_game(scheduled_game['save'], scheduled_game['blue'], scheduled_game['red'], max_turns, scheduled_game['seed'], budget=budget)
+    except Exception:
+        record['error'] = traceback.format_exc()
+        return record
+    record['winner'] = result.winner
+    record['turns']  = result.turns
+    for color in (PlayerColor.BLUE, PlayerColor.RED):
+        times = result.get_move_times(color)
+        record[f'{color}_moves'] = len(times)
+        record[f'{color}_time']  = sum(times)
+    return record
+
+
+def load_results(filename):
+    '''
+    Returns the results already written in the JSON lines file, as a dictionary from game id to result.
+    A partially written last line (left by an interruption) is ignored.
+    '''
+    results = {}
+    if not os.path.exists(filename):
+        return results
+    with open(filename, 'r') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            results[record['id']] = record
+    return results
+
+
+def run(scheduled, filename, workers=None, max_turns=simulate.DEFAULT_MAX_TURNS, verbose=True, budget=None):
+    '''
+    Plays the scheduled games that do not yet have a result in 'filename', and appends their results to it.
+    @param workers: Number of processes, or None for one per core
+    @param budget:  Time budget per move in seconds, or None for no limit
+    @return: Dictionary from game id to result, including the earlier results
+    '''
+    results = load_results(filename)
+    remaining = [ game for game in scheduled if game['id'] not in results ]
+    if verbose:
+        print(f"{len(scheduled)} games, {len(scheduled)-len(remaining)} already played")
+    if len(remaining) == 0:
+        return results
+
+    # Start on a new line in case the last line was left unfinished
+    unfinished = False
+    if os.path.exists(filename) and os.path.getsize(filename) > 0:
+        with open(filename, 'rb') as file:
+            file.seek(-1, os.SEEK_END)
+            unfinished = file.read(1) != b'\n'
+    with open(filename, 'a') as file:
+        if unfinished:
+            file.write('\n')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [ pool.submit(play, game, max_turns, budget) for game in remaining ]
+            for future in concurrent.futures.as_completed(futures):
+                record = future.result()
+                results[record['id']] = record
+                file.write(json.dumps(record) + '\n')
+                file.flush()
+                if verbose:
+                    outcome = "error" if 'error' in record else f"winner {record['winner']}, {record['turns']} turns"
+                    print(f"{len(results)}/{len(scheduled)} {record['id']}: {outcome}")
+    return results
+
+
+def elo_ratings(records, ais):
+    '''
+    Returns a dictionary from AI to its Elo rating after the given games, played in the given order.
+    A game without a winner counts as a draw.
+    '''
+    ratings = { ai: ELO_START for ai in ais }
+    for record in records:
+        blue, red = record['blue'], record['red']
+        expected = 1 / (1 + 10 ** ((ratings[red] - ratings[blue]) / 400))
+        if record['winner'] == PlayerColor.BLUE:
+            score = 1
+        elif record['winner'] == PlayerColor.RED:
+            score = 0
+        else:
+            score = 0.5
+        ratings[blue] += ELO_K * (score - expected)
+        ratings[red]  -= ELO_K * (score - expected)
+    return ratings
+
+
+def results_table(scheduled, results, ais):
+    '''
+    Returns the results of the tournament as a printable table: games, wins, draws, win rate, Elo rating,
+    mean length of the AI's games in turns and mean think time per move of each AI.
+    The Elo ratings are calculated in the order of the schedule, so they do not depend on which games finished first.
+    '''
+    records = [ results[game['id']] for game in scheduled if game['id'] in results and 'error' not in results[game['id']] ]
+    errors  = sum( 1 for game in scheduled if game['id'] in results and 'error' in results[game['id']] )
+    ratings = elo_ratings(records, ais)
+
+    lines = [f"{'AI':<12} {'games':>6} {'wins':>5} {'draws':>6} {'win %':>6} {'elo':>6} {'turns':>6} {'ms/move':>8}"]
+    for ai in sorted(ais, key=lambda ai: -ratings[ai]):
+        games = wins = draws = turns = moves = 0
+        think_time = 0.0
+        for record in records:
+            for color in (PlayerColor.BLUE, PlayerColor.RED):
+                if record[color] != ai:
+                    continue
+                games      += 1
+                wins       += record['winner'] == color
+                draws      += record['winner'] is None
+                turns      += record['turns']
+                moves      += record[f'{color}_moves']
+                think_time += record[f'{color}_time']
+        win_rate  = 100 * wins / games if games > 0 else 0
+        mean_turns = turns / games if games > 0 else 0
+        mean_time = 1000 * think_time / moves if moves > 0 else 0
+        lines.append(f"{ai:<12} {games:>6} {wins:>5} {draws:>6} {win_rate:>6.1f} {ratings[ai]:>6.0f} {mean_turns:>6.1f} {mean_time:>8.1f}")
+    if errors > 0:
+        lines.append(f"{errors} games ended in an error (see the results file)")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plays a tournament between AI modules.')
+    parser.add_argument('results', help='JSON lines file for the results; an existing file is continued')
+    parser.add_argument('--ai', nargs='+', default=['game_ai_1', 'game_ai_2', 'game_ai_3', 'game_ai_4'], help='AI modules')
+    parser.add_argument('--saves', nargs='+', default=[configload.get_filepath('savedata', 'save_yaml.yaml')], help='save files to play on')
+    parser.add_argument('--games', type=int, default=1, help='games per pair of AIs, map and color (default 1)')
+    parser.add_argument('--seed', type=int, default=0, help='tournament seed (default 0)')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: one per core)')
+    parser.add_argument('--max-turns', type=int, default=simulate.DEFAULT_MAX_TURNS, help=f'maximum number of turns per game (default {simulate.DEFAULT_MAX_TURNS})')
+    parser.add_argument('--budget', type=float, default=None, help='time budget per move in seconds (default: no limit)')
+    parser.add_argument('--table', default=None, help='file to write the results table to')
+    args = parser.parse_args()
+
+    scheduled = schedule(args.ai, args.saves, args.games, args.seed)
+    results = run(scheduled, args.results, args.workers, args.max_turns, budget=args.budget)
+    table = results_table(scheduled, results, args.ai)
+    print(table)
+    if args.table is not None:
+        with open(args.table, 'w') as file:
+            file.write(table + '\n')
+
+
+if __name__ == '__main__':
+    main()
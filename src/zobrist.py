@@ -0,0 +1,100 @@
+'''
+Zobrist hashing of the game state, and a transposition table for the AI.
+
+The hash of a board is the XOR of the hashes of the objects on it. The hash of a character depends on its
+square, class, color, HP bucket, readiness, skills and stats, so that two boards where the characters are in
+the same state get the same hash. The board keeps its hash up to date as the characters change (see
+Board.update_hash), so it is available without going through the whole board.
+
+The random key of each feature is derived from the feature itself, so the hashes are the same in every process.
+'''
+from collections import OrderedDict
+import hashlib
+
+
+# Width of the HP buckets. With 1 every HP value has its own bucket, so that states with equal hashes are
+# evaluated equally by the AI.
+HP_BUCKET_SIZE = 1
+
+# Feature -> its 64-bit random key
+keys = {}
+
+
+def key(feature):
+    '''
+    Returns the 64-bit random key of a feature, which is a tuple describing one aspect of the game state.
+    '''
+    k = keys.get(feature)
+    if k is None:
+        k = int.from_bytes(hashlib.blake2b(repr(feature).encode(), digest_size=8).digest(), 'little')
+        keys[feature] = k
+    return k
+
+
+def object_hash(object, square):
+    '''
+    Returns the hash of an object standing on the given square.
+    '''
+    if not hasattr(object, 'hp'):
+        return key(('object', square, type(object).__name__))
+    h  = key(('char', square, object.type, object.color))
+    h ^= key(('hp', square, object.hp // HP_BUCKET_SIZE))
+    if object.ready:
+        h ^= key(('ready', square))
+    for sk in object.skills:
+        h ^= key(('skill', square, sk.type, sk.use_count, sk.has_ended))
+    h ^= key(('stats', square, tuple(object.stats.values())))
+    return h
+
+
+def terrain_hash(width, height, terrain_grid):
+    '''
+    Returns the part of the game's hash identifying the map: its size and the terrain of every square.
+    Without it, two maps with the same characters on the same squares would share their cached results.
+    @param terrain_grid: Terrain ids of the squares, as stored by the board
+    '''
+    data = repr((width, height)).encode() + bytes(terrain_grid)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def turn_hash(player_color):
+    '''
+    Returns the part of the game's hash telling whose turn it is.
+    '''
+    return key(('turn', player_color))
+
+
+class TranspositionTable:
+    '''
+    Bounded cache of results keyed by (tuples including) Zobrist hashes.
+    When the table is full, the least recently used entry is dropped.
+    '''
+    def __init__(self, max_entries) -> None:
+        self.max_entries = max(1, max_entries)
+        self.entries     = OrderedDict()
+        self.hits        = 0
+        self.misses      = 0
+
+    def get(self, key):
+        '''
+        Returns the entry stored with 'key', or None.
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)